@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import patch
+
+from dhan_risk_manager import CONFIG, RiskConfig, validate_config
+
+
+class ValidateConfigTest(unittest.TestCase):
+    def setUp(self):
+        # validate_config() also stores parsed values in CONFIG; restore it after each test
+        patcher = patch.dict(CONFIG, {"ACCESS_TOKEN": "test_token", "TELEGRAM_ENABLED": False})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unparseable_trailing_settings_are_reported_not_raised(self):
+        # "abc" in the environment is stored as None by load_config()
+        CONFIG.update({
+            "ENABLE_TRAILING_STOPLOSS": True,
+            "TRAILING_STOPLOSS_ACTIVATE_PROFIT": None,
+            "TRAILING_STOPLOSS_TRAIL_PERCENT": None,
+        })
+
+        errors = validate_config()
+
+        self.assertIn("TRAILING_STOPLOSS_ACTIVATE_PROFIT must be a number", errors)
+        self.assertIn("TRAILING_STOPLOSS_TRAIL_PERCENT must be a number", errors)
+        self.assertNotIn("TRAILING_STOPLOSS_ACTIVATE_PROFIT must be positive", errors)
+
+    def test_trailing_range_still_checked(self):
+        CONFIG.update({
+            "ENABLE_TRAILING_STOPLOSS": True,
+            "TRAILING_STOPLOSS_ACTIVATE_PROFIT": 500.0,
+            "TRAILING_STOPLOSS_TRAIL_PERCENT": 150.0,
+        })
+
+        self.assertIn("TRAILING_STOPLOSS_TRAIL_PERCENT must be between 0 and 100", validate_config())
+
+
+class RiskConfigTest(unittest.TestCase):
+    def test_risk_settings_are_coerced_once(self):
+        settings = RiskConfig.from_config({
+            "DAILY_STOPLOSS": "-1000",
+            "DAILY_TARGET": 2000,
+            "ENABLE_POSITION_PERCENT_TAKE": False,
+            "POSITION_PERCENT_TAKE": 5.0,
+        })
+        self.assertEqual(settings.daily_stoploss, -1000.0)
+        self.assertEqual(settings.position_percent_take, 0.0)  # Disabled checks read as 0
+        with self.assertRaises(AttributeError):
+            settings.daily_target = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
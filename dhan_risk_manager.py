@@ -5,11 +5,27 @@ Monitors positions PNL and triggers kill switch based on daily limits
 from dotenv import load_dotenv
 import os
 import requests
-import schedule
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import json
-from datetime import datetime
+import heapq
+import queue
+import select
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import count, islice
+from operator import itemgetter
+from types import MappingProxyType
+from datetime import datetime, timedelta
 import logging
+import logging.handlers
+import atexit
+import signal
 import sys
 
 # ============================================================================
@@ -17,8 +33,12 @@ import sys
 # ============================================================================
 load_dotenv()  # Loads variables from .env into environment
 
+# Fallback token file lives next to this script
+TOKEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dhan_token.txt")
+
+@lru_cache(maxsize=1)
 def get_dhan_token():
-    """Get Access Token from Env, fallback to file if missing"""
+    """Get Access Token from Env, fallback to file if missing (resolved once per process)"""
     # 1. Try Environment Variable (.env)
     token = os.getenv("DHAN_ACCESS_TOKEN")
     if token and token.strip():
@@ -27,11 +47,8 @@ def get_dhan_token():
     # 2. Try Fallback File
     # (Looks for 'dhan_token.txt' in the same folder as this script)
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        token_file = os.path.join(script_dir, "dhan_token.txt")
-        
-        if os.path.exists(token_file):
-            with open(token_file, "r") as f:
+        if os.path.exists(TOKEN_FILE):
+            with open(TOKEN_FILE, "r") as f:
                 file_token = f.read().strip()
                 if file_token:
                     return file_token
@@ -40,41 +57,8 @@ def get_dhan_token():
         
     return None
 
-CONFIG = {
-    "ACCESS_TOKEN": get_dhan_token(),  # Dhan API Access Token
-    "DAILY_STOPLOSS": float(os.getenv("DAILY_STOPLOSS")), # Stoploss threshold: negative to trigger on loss, 0 to trigger at breakeven, positive to trigger when in profit
-    "DAILY_TARGET": float(os.getenv("DAILY_TARGET")), # Stop if profit reaches this (positive value)
-    "CHECK_INTERVAL_SECONDS": int(os.getenv("CHECK_INTERVAL_SECONDS")), # How often to check PNL (in seconds)
-    "MARKET_START_TIME": os.getenv("MARKET_START_TIME"), # Market opening time
-    "MARKET_END_TIME": os.getenv("MARKET_END_TIME"), # Market closing time
-    "ENABLE_LOGGING": True,                     # Save logs to file
-    # Read log file path from environment variable `LOG_FILE`, fallback to default name
-    "LOG_FILE": os.getenv("LOG_FILE", "/tmp/dhan_risk_manager.log"),       # Log file name
-    # Logging level (e.g. DEBUG, INFO, WARN, ERROR). Read from .env via LOG_LEVEL
-    "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARN"),
-    
-    # Telegram Configuration (booleans parsed from env)
-    "TELEGRAM_ENABLED": os.getenv("TELEGRAM_ENABLED"),       # Enable Telegram notifications (parsed later)
-    "TELEGRAM_BOT_TOKEN": os.getenv("TELEGRAM_BOT_TOKEN"),    # Get from @BotFather
-    "TELEGRAM_CHAT_ID": os.getenv("TELEGRAM_CHAT_ID"),        # Your Telegram chat ID
-    "SEND_PNL_UPDATES": os.getenv("SEND_PNL_UPDATES"),      # Send PNL on every check (parsed later)
-    "SEND_ONLY_ALERTS": os.getenv("SEND_ONLY_ALERTS"),       # Only send stoploss/target alerts (not every check) (parsed later)
-    # Per-position percent-based profit taking
-    "ENABLE_POSITION_PERCENT_TAKE": os.getenv("ENABLE_POSITION_PERCENT_TAKE"),  # Enable per-position percent take
-    "POSITION_PERCENT_TAKE": float(os.getenv("POSITION_PERCENT_TAKE") or 0.0),  # Percent profit threshold per position (e.g., 5.0)
-    # Per-position percent-based stoploss
-    "ENABLE_POSITION_PERCENT_STOPLOSS": os.getenv("ENABLE_POSITION_PERCENT_STOPLOSS"),  # Enable per-position percent stoploss
-    "POSITION_PERCENT_STOPLOSS": float(os.getenv("POSITION_PERCENT_STOPLOSS") or 0.0),  # Percent stoploss threshold per position (positive value, e.g., 2.0 means -2%)
-    # Trailing Stoploss Configuration
-    "ENABLE_TRAILING_STOPLOSS": os.getenv("ENABLE_TRAILING_STOPLOSS"),  # Enable trailing stoploss feature
-    "TRAILING_STOPLOSS_ACTIVATE_PROFIT": float(os.getenv("TRAILING_STOPLOSS_ACTIVATE_PROFIT") or 0.0), # Profit level to activate trailing
-    "TRAILING_STOPLOSS_TRAIL_PERCENT": float(os.getenv("TRAILING_STOPLOSS_TRAIL_PERCENT") or 0.0),  # Trail percentage (e.g., 10 for 10%)
-    "ENABLE_KILL_SWITCH": os.getenv("ENABLE_KILL_SWITCH"),      # Activate Dhan's kill switch on limit breach
-    "RUN_DAYS": os.getenv("RUN_DAYS", "WEEKDAYS"),              # Days to run: ALL, WEEKDAYS, WEEKENDS, or MON,TUE...
-    # Telegram periodic PNL alert interval (seconds). 0 or missing => disabled
-    "TELEGRAM_PNL_INTERVAL_SECONDS": int(os.getenv("TELEGRAM_PNL_INTERVAL_SECONDS") or 0),
-}
-
+# Accepted spellings of "true" for boolean env values
+_TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
 
 # Helper to parse boolean-ish env values
 def _env_to_bool(val, default=False):
@@ -82,62 +66,119 @@ def _env_to_bool(val, default=False):
         return val
     if val is None:
         return default
-    return str(val).strip().lower() in ("1", "true", "yes", "y", "on")
-
-# Normalize boolean-like config values (overwrite string values with booleans)
-CONFIG["TELEGRAM_ENABLED"] = _env_to_bool(CONFIG.get("TELEGRAM_ENABLED"), False)
-CONFIG["SEND_PNL_UPDATES"] = _env_to_bool(CONFIG.get("SEND_PNL_UPDATES"), False)
-CONFIG["SEND_ONLY_ALERTS"] = _env_to_bool(CONFIG.get("SEND_ONLY_ALERTS"), False)
-CONFIG["ENABLE_POSITION_PERCENT_TAKE"] = _env_to_bool(CONFIG.get("ENABLE_POSITION_PERCENT_TAKE"), False)
-CONFIG["ENABLE_POSITION_PERCENT_STOPLOSS"] = _env_to_bool(CONFIG.get("ENABLE_POSITION_PERCENT_STOPLOSS"), False)
-CONFIG["ENABLE_TRAILING_STOPLOSS"] = _env_to_bool(CONFIG.get("ENABLE_TRAILING_STOPLOSS"), False)
-CONFIG["ENABLE_KILL_SWITCH"] = _env_to_bool(CONFIG.get("ENABLE_KILL_SWITCH"), False)
-
-# Normalize log level string to numeric logging level
-try:
-    _lvl_name = str(CONFIG.get("LOG_LEVEL", "WARN")).strip().upper()
-except Exception:
-    _lvl_name = "WARN"
-
-_LOG_LEVEL_MAP = {
-    'CRITICAL': logging.CRITICAL,
-    'FATAL': logging.CRITICAL,
-    'ERROR': logging.ERROR,
-    'WARN': logging.WARNING,
-    'WARNING': logging.WARNING,
-    'INFO': logging.INFO,
-    'DEBUG': logging.DEBUG,
-    'NOTSET': logging.NOTSET
-}
-
-CONFIG["LOG_LEVEL_NUM"] = _LOG_LEVEL_MAP.get(_lvl_name, logging.WARNING)
-
-# If periodic Telegram PNL updates are enabled, disable per-check PNL sends to avoid duplicates
-if CONFIG.get("TELEGRAM_PNL_INTERVAL_SECONDS", 0) > 0:
-    CONFIG["EFFECTIVE_SEND_PNL_UPDATES"] = False
-else:
-    CONFIG["EFFECTIVE_SEND_PNL_UPDATES"] = CONFIG["SEND_PNL_UPDATES"]
+    return str(val).strip().lower() in _TRUTHY
+
+# Helper to parse numeric env values; None marks a missing or invalid value for validate_config()
+def _env_to_number(val, cast, default=None):
+    if val is None or not str(val).strip():
+        return default
+    try:
+        return cast(str(val).strip())
+    except ValueError:
+        return None
+
+def load_config():
+    """Read the environment once and return the fully parsed configuration"""
+    env = dict(os.environ)  # Single snapshot of the environment
+    config = {
+        "ACCESS_TOKEN": get_dhan_token(),  # Dhan API Access Token
+        "DAILY_STOPLOSS": _env_to_number(env.get("DAILY_STOPLOSS"), float), # Stoploss threshold: negative to trigger on loss, 0 to trigger at breakeven, positive to trigger when in profit
+        "DAILY_TARGET": _env_to_number(env.get("DAILY_TARGET"), float), # Stop if profit reaches this (positive value)
+        "CHECK_INTERVAL_SECONDS": _env_to_number(env.get("CHECK_INTERVAL_SECONDS"), int), # How often to check PNL (in seconds)
+        "MARKET_START_TIME": env.get("MARKET_START_TIME"), # Market opening time
+        "MARKET_END_TIME": env.get("MARKET_END_TIME"), # Market closing time
+        "ENABLE_LOGGING": True,                     # Save logs to file
+        # Read log file path from environment variable `LOG_FILE`, fallback to default name
+        "LOG_FILE": env.get("LOG_FILE", "/tmp/dhan_risk_manager.log"),       # Log file name
+        # Logging level (e.g. DEBUG, INFO, WARN, ERROR). Read from .env via LOG_LEVEL
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARN"),
+
+        # Telegram Configuration (booleans parsed from env)
+        "TELEGRAM_ENABLED": _env_to_bool(env.get("TELEGRAM_ENABLED")),       # Enable Telegram notifications
+        "TELEGRAM_BOT_TOKEN": env.get("TELEGRAM_BOT_TOKEN"),    # Get from @BotFather
+        "TELEGRAM_CHAT_ID": env.get("TELEGRAM_CHAT_ID"),        # Your Telegram chat ID
+        "SEND_PNL_UPDATES": _env_to_bool(env.get("SEND_PNL_UPDATES")),      # Send PNL on every check
+        "SEND_ONLY_ALERTS": _env_to_bool(env.get("SEND_ONLY_ALERTS")),       # Only send stoploss/target alerts (not every check)
+        # Per-position percent-based profit taking
+        "ENABLE_POSITION_PERCENT_TAKE": _env_to_bool(env.get("ENABLE_POSITION_PERCENT_TAKE")),  # Enable per-position percent take
+        "POSITION_PERCENT_TAKE": _env_to_number(env.get("POSITION_PERCENT_TAKE"), float, 0.0),  # Percent profit threshold per position (e.g., 5.0)
+        # Per-position percent-based stoploss
+        "ENABLE_POSITION_PERCENT_STOPLOSS": _env_to_bool(env.get("ENABLE_POSITION_PERCENT_STOPLOSS")),  # Enable per-position percent stoploss
+        "POSITION_PERCENT_STOPLOSS": _env_to_number(env.get("POSITION_PERCENT_STOPLOSS"), float, 0.0),  # Percent stoploss threshold per position (positive value, e.g., 2.0 means -2%)
+        # Trailing Stoploss Configuration
+        "ENABLE_TRAILING_STOPLOSS": _env_to_bool(env.get("ENABLE_TRAILING_STOPLOSS")),  # Enable trailing stoploss feature
+        "TRAILING_STOPLOSS_ACTIVATE_PROFIT": _env_to_number(env.get("TRAILING_STOPLOSS_ACTIVATE_PROFIT"), float, 0.0), # Profit level to activate trailing
+        "TRAILING_STOPLOSS_TRAIL_PERCENT": _env_to_number(env.get("TRAILING_STOPLOSS_TRAIL_PERCENT"), float, 0.0),  # Trail percentage (e.g., 10 for 10%)
+        "ENABLE_KILL_SWITCH": _env_to_bool(env.get("ENABLE_KILL_SWITCH")),      # Activate Dhan's kill switch on limit breach
+        "RUN_DAYS": env.get("RUN_DAYS", "WEEKDAYS"),              # Days to run: ALL, WEEKDAYS, WEEKENDS, or MON,TUE...
+        # Telegram periodic PNL alert interval (seconds). 0 or missing => disabled
+        "TELEGRAM_PNL_INTERVAL_SECONDS": _env_to_number(env.get("TELEGRAM_PNL_INTERVAL_SECONDS"), int, 0),
+    }
+
+    # If periodic Telegram PNL updates are enabled, disable per-check PNL sends to avoid duplicates
+    if (config["TELEGRAM_PNL_INTERVAL_SECONDS"] or 0) > 0:
+        config["EFFECTIVE_SEND_PNL_UPDATES"] = False
+    else:
+        config["EFFECTIVE_SEND_PNL_UPDATES"] = config["SEND_PNL_UPDATES"]
+
+    # Normalize log level string to numeric logging level; logging already knows the
+    # standard names and the WARN/FATAL aliases, unknown names come back as a string
+    level_num = logging.getLevelName(str(config["LOG_LEVEL"]).strip().upper())
+    config["LOG_LEVEL_NUM"] = level_num if isinstance(level_num, int) else logging.WARNING
+
+    return config
+
+CONFIG = load_config()
 
 # ============================================================================
 # LOGGING SETUP
 # ============================================================================
 
+# Divider line used in log banners
+_BAR = "=" * 70
+
+# Background listener that performs the actual file/console writes
+_log_listener = None
+# stdout only needs switching to UTF-8 once, even if setup_logging() runs again
+_stdout_utf8_configured = False
+
+def _stop_log_listener():
+    """Flush queued and buffered log records and stop the listener thread"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.flush()
+        _log_listener = None
+
 def setup_logging():
     """Setup logging configuration with UTF-8 encoding for Windows compatibility"""
-    log_format = '%(asctime)s - %(levelname)s - %(message)s'
+    global _log_listener, _stdout_utf8_configured
+    # One formatter shared by the file and console handlers
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     # Create handlers with UTF-8 encoding for Windows compatibility
     root = logging.getLogger()
     # Remove existing handlers to avoid duplicate logs on reload
     for h in list(root.handlers):
         root.removeHandler(h)
+    _stop_log_listener()
+    handlers = []
 
     # File handler with UTF-8 encoding (optional)
     if CONFIG.get("ENABLE_LOGGING"):
         try:
-            file_handler = logging.FileHandler(CONFIG["LOG_FILE"], encoding='utf-8')
+            # Bounded log size; no external rotation needed
+            file_handler = logging.handlers.RotatingFileHandler(
+                CONFIG["LOG_FILE"], maxBytes=5_000_000, backupCount=3, encoding='utf-8'
+            )
             file_handler.setLevel(CONFIG.get("LOG_LEVEL_NUM", logging.WARNING))
-            file_handler.setFormatter(logging.Formatter(log_format))
-            root.addHandler(file_handler)
+            file_handler.setFormatter(formatter)
+            # Batch file writes; WARNING and above (breaches, square-offs, errors) flush immediately
+            buffered_handler = logging.handlers.MemoryHandler(
+                capacity=512, flushLevel=logging.WARNING, target=file_handler, flushOnClose=True
+            )
+            buffered_handler.setLevel(CONFIG.get("LOG_LEVEL_NUM", logging.WARNING))
+            handlers.append(buffered_handler)
         except Exception:
             # Fallback: skip file handler if it fails to open
             pass
@@ -145,55 +186,297 @@ def setup_logging():
     # Console handler with UTF-8 encoding
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(CONFIG.get("LOG_LEVEL_NUM", logging.WARNING))
-    console_handler.setFormatter(logging.Formatter(log_format))
-    # Set UTF-8 encoding for console output (Python 3.7+)
-    if hasattr(sys.stdout, 'reconfigure'):
-        try:
-            sys.stdout.reconfigure(encoding='utf-8')
-        except Exception:
-            pass
-    root.addHandler(console_handler)
+    console_handler.setFormatter(formatter)
+    # Set UTF-8 encoding for console output once per process (Python 3.7+)
+    if not _stdout_utf8_configured:
+        if hasattr(sys.stdout, 'reconfigure'):
+            try:
+                sys.stdout.reconfigure(encoding='utf-8')
+            except Exception:
+                pass
+        _stdout_utf8_configured = True
+    handlers.append(console_handler)
+
+    # The polling loop only enqueues records; disk and stdout writes happen on the listener thread
+    log_queue = queue.Queue(-1)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
 
     # Ensure root logger level is set from config
     root.setLevel(CONFIG.get("LOG_LEVEL_NUM", logging.WARNING))
 
+# Drain pending records on exit, including the sys.exit() after a kill switch
+atexit.register(_stop_log_listener)
+
 # ============================================================================
 # TELEGRAM NOTIFICATION CLASS
 # ============================================================================
 
+# Timestamp formats shown in Telegram messages
+_TIME_FORMAT = '%I:%M:%S %p'
+_DATE_FORMAT = '%d %B %Y'
+
+_KILL_SWITCH_ACTIONS_ENABLED = """
+<b>Actions being taken:</b>
+1️⃣ Squaring off all positions
+2️⃣ Cancelling all pending orders
+3️⃣ Disabling trading for today
+"""
+
+_KILL_SWITCH_ACTIONS_DISABLED = """
+<b>Actions being taken:</b>
+1️⃣ Squaring off all positions
+2️⃣ Cancelling all pending orders
+
+⚠️ <i>Kill Switch activation is disabled.</i>
+"""
+
+_KILL_SWITCH_ALERT_TEMPLATE = """
+{emoji}{emoji}{emoji} <b>{title}</b> {emoji}{emoji}{emoji}
+
+{color} <b>P&L:</b> ₹{pnl:,.2f}
+{color} <b>Limit:</b> ₹{limit_value:,.2f}
+
+⚡ <b>{action_title}</b>
+
+{action_details}
+⏰ Time: {time}
+📅 Date: {date}
+
+🛑 <b>Shutdown in progress...</b>
+"""
+
+_PNL_UPDATE_TEMPLATE = """
+{emoji} <b>PNL Update</b> {emoji}
+
+💰 <b>Current P&L:</b> ₹{pnl:,.2f} ({pnl_status})
+
+📊 <b>Risk Limits:</b>
+   🔴 Stoploss: ₹{stoploss:,.2f} ({distance_from_sl:.1f}% away)
+   🟢 Target: ₹{target:,.2f} ({distance_from_target:.1f}% away)
+
+⏰ Time: {time}
+{positions}"""
+
+_STARTUP_TEMPLATE = """
+🤖 <b>Dhan Risk Manager Started</b>
+
+📊 <b>Configuration:</b>
+   🔴 Stoploss: ₹{DAILY_STOPLOSS:,.2f}
+   🟢 Target: ₹{DAILY_TARGET:,.2f}
+   ⏱ Check Interval: {CHECK_INTERVAL_SECONDS} second(s)
+"""
+
+_STARTUP_TRAILING_SECTION = """
+   🚀 <b>Trailing SL Enabled</b>
+      - Activate at: ₹{TRAILING_STOPLOSS_ACTIVATE_PROFIT:,.2f}
+      - Trail by: {TRAILING_STOPLOSS_TRAIL_PERCENT}%
+"""
+
+_STARTUP_PERCENT_TAKE_SECTION = """
+   📈 <b>Per-Position Take-Profit Enabled</b>
+      - Profit Percent: {POSITION_PERCENT_TAKE}%
+"""
+
+_STARTUP_PERCENT_STOPLOSS_SECTION = """
+   🛑 <b>Per-Position Stoploss Enabled</b>
+      - Stoploss Percent: {POSITION_PERCENT_STOPLOSS}%
+"""
+
+_STARTUP_KILL_SWITCH_SECTION = """
+   ✅ <b>Kill Switch Activation Enabled</b>
+"""
+
+_STARTUP_FOOTER_TEMPLATE = """
+🕐 Market Hours: {MARKET_START_TIME} - {MARKET_END_TIME}
+📅 Run Days: {run_days}
+
+✅ Monitoring active
+⏰ Started: {time}
+"""
+
+_ERROR_ALERT_TEMPLATE = """
+⚠️ <b>Error Alert</b>
+
+❌ {error_message}
+
+⏰ Time: {time}
+
+⚠️ Please check the logs or system
+"""
+
 class TelegramNotifier:
+    # Bounded so a slow or unreachable Telegram API cannot grow the backlog without limit
+    QUEUE_MAX_SIZE = 32
+    # Telegram's per-chat limits: about one message per second, and 20 per minute in groups
+    MIN_SEND_INTERVAL_SECONDS = 1.0
+    MAX_SENDS_PER_MINUTE = 20
+    # An unchanged periodic PNL update is still re-sent this often, as a heartbeat
+    PNL_HEARTBEAT_SECONDS = 300
+
     def __init__(self, bot_token, chat_id, enabled=True):
         self.bot_token = bot_token
         self.chat_id = chat_id
         self.enabled = enabled
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        self.send_url = f"{self.base_url}/sendMessage"
+        # Reuse keep-alive connections to api.telegram.org instead of a new TLS handshake per message.
+        # Kept separate from the Dhan session so the Dhan access-token header never reaches Telegram.
+        self.session = requests.Session()
+        # The background worker retries rate limiting (429) and gateway errors briefly. Read errors are
+        # not retried (the message may already have been delivered), and Retry-After is ignored so one
+        # throttled message cannot hold up the queue for tens of seconds.
+        retry = Retry(
+            total=2,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry))
+        # Synchronous alerts (breach, startup, fatal errors) are sent from the risk loop thread, ahead of
+        # cancel and square-off: they get one attempt only, so an unreachable Telegram costs one timeout
+        self.alert_session = requests.Session()
+        self.alert_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+        # Non-critical messages are sent by a single background worker so the risk loop never waits on Telegram
+        self._queue = queue.Queue(maxsize=self.QUEUE_MAX_SIZE)
+        # Monotonic times of recent sends (queued and synchronous), used to pace the worker
+        self._sent_at = deque(maxlen=self.MAX_SENDS_PER_MINUTE)
+        # Newest not-yet-sent PNL update; older snapshots are replaced rather than queued behind it
+        self._latest_lock = threading.Lock()
+        self._latest_message = None
+        # (signature, monotonic send time) of the last periodic PNL update, to skip repeats
+        self._last_pnl_update = None
+        self._worker = None
+        if enabled:
+            self._worker = threading.Thread(target=self._drain_queue, name="telegram-sender", daemon=True)
+            self._worker.start()
+
+    def _drain_queue(self):
+        """Background worker: send queued messages one at a time"""
+        while True:
+            self._send_next()
+
+    def _send_next(self):
+        """Take one item off the queue and send it, pacing sends to Telegram's limits"""
+        item = self._queue.get()
+        try:
+            if item is None:
+                # Placeholder for a latest-only message: send whatever is newest now
+                with self._latest_lock:
+                    item, self._latest_message = self._latest_message, None
+            if item is not None:
+                self._wait_for_send_slot()
+                self.send_message(*item, retry=True)
+        finally:
+            self._queue.task_done()
+
+    def _wait_for_send_slot(self):
+        """Sleep until another send stays within Telegram's per-chat rate limits (worker thread only)"""
+        now = time.monotonic()
+        wait = 0.0
+        if self._sent_at:
+            wait = self.MIN_SEND_INTERVAL_SECONDS - (now - self._sent_at[-1])
+        if len(self._sent_at) == self._sent_at.maxlen:
+            # Sliding one-minute window: the oldest of the last N sends must have aged out
+            wait = max(wait, 60.0 - (now - self._sent_at[0]))
+        if wait > 0:
+            time.sleep(wait)
+
+    def queue_message(self, message, parse_mode="HTML", latest_only=False):
+        """Queue a message for the background sender without blocking the caller
+
+        With `latest_only`, a still-unsent latest-only message is replaced instead of
+        queueing another one, so a backlog of periodic snapshots collapses to the newest.
+        """
+        if not self.enabled:
+            return False
+
+        item = (message, parse_mode)
+        if latest_only:
+            with self._latest_lock:
+                already_queued = self._latest_message is not None
+                self._latest_message = item
+            if already_queued:
+                return True
+            item = None
+
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            if latest_only:
+                with self._latest_lock:
+                    self._latest_message = None
+            logging.warning("Telegram queue is full; dropping message")
+            return False
         
-    def send_message(self, message, parse_mode="HTML"):
-        """Send a message via Telegram"""
+    def send_message(self, message, parse_mode="HTML", retry=False):
+        """Send a message via Telegram (`retry` is for the background worker only)"""
         if not self.enabled:
             return False
             
-        url = f"{self.base_url}/sendMessage"
         payload = {
             "chat_id": self.chat_id,
             "text": message,
             "parse_mode": parse_mode
         }
         
+        self._sent_at.append(time.monotonic())
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            session = self.session if retry else self.alert_session
+            response = session.post(self.send_url, json=payload, timeout=10)
             if response.status_code == 200:
                 logging.info("✓ Telegram notification sent")
                 return True
             else:
-                logging.error(f"Failed to send Telegram: {response.status_code} - {response.text}")
+                logging.error("Failed to send Telegram: %s - %s", response.status_code, response.text)
                 return False
         except Exception as e:
-            logging.error(f"Error sending Telegram notification: {e}")
+            logging.error("Error sending Telegram notification: %s", e)
             return False
     
-    def send_pnl_update(self, pnl, stoploss, target, positions_data=None):
-        """Send PNL update message"""
+    @staticmethod
+    def _format_positions(positions_data, limit=5):
+        """Positions section of a PNL update: the first `limit` positions, then a count of the rest"""
+        if not positions_data:
+            return "\n📋 <b>All positions are closed.</b>\n"
+
+        lines = [
+            f"   {'🟢' if pos['total'] >= 0 else '🔴'} {pos['symbol']}: ₹{pos['total']:,.2f}"
+            f"{' (' + pos['status'] + ')' if pos.get('status') else ''}\n"
+            for pos in islice(positions_data, limit)
+        ]
+        if len(positions_data) > limit:
+            lines.append(f"   ... and {len(positions_data) - limit} more\n")
+        return "\n📋 <b>Positions:</b>\n" + "".join(lines)
+
+    def send_pnl_update(self, pnl, stoploss, target, positions_data=None, now=None, skip_unchanged=False):
+        """Send PNL update message (`now` lets the caller reuse its own clock reading)
+
+        With `skip_unchanged`, an update identical to the last one sent this way is
+        skipped unless PNL_HEARTBEAT_SECONDS have passed since then.
+        """
+        if not self.enabled:
+            return False
+
+        if skip_unchanged:
+            signature = (
+                round(pnl, 2), stoploss, target,
+                tuple((pos['symbol'], round(pos['total'], 2), pos.get('status')) for pos in positions_data or ()),
+            )
+            sent_at = time.monotonic()
+            last = self._last_pnl_update
+            if last and last[0] == signature and sent_at - last[1] < self.PNL_HEARTBEAT_SECONDS:
+                logging.debug("PNL unchanged since last update; skipping Telegram message")
+                return False
+
+        if now is None:
+            now = datetime.now()
+
         # Determine emoji based on PNL
         if pnl > 0:
             emoji = "📈"
@@ -209,35 +492,30 @@ class TelegramNotifier:
         distance_from_sl = ((pnl - stoploss) / abs(stoploss)) * 100 if stoploss != 0 else 0
         distance_from_target = ((target - pnl) / target) * 100 if target != 0 else 0
         
-        message = f"""
-{emoji} <b>PNL Update</b> {emoji}
-
-💰 <b>Current P&L:</b> ₹{pnl:,.2f} ({pnl_status})
-
-📊 <b>Risk Limits:</b>
-   🔴 Stoploss: ₹{stoploss:,.2f} ({distance_from_sl:.1f}% away)
-   🟢 Target: ₹{target:,.2f} ({distance_from_target:.1f}% away)
-
-⏰ Time: {datetime.now().strftime('%I:%M:%S %p')}
-"""
-        
-        # Add position details if provided
-        if positions_data:
-            message += "\n📋 <b>Positions:</b>\n"
-            for pos in positions_data[:5]:  # Limit to 5 positions
-                pnl_emoji = "🟢" if pos['total'] >= 0 else "🔴"
-                status_str = f" ({pos['status']})" if pos.get('status') else ""
-                message += f"   {pnl_emoji} {pos['symbol']}: ₹{pos['total']:,.2f}{status_str}\n"
-            
-            if len(positions_data) > 5:
-                message += f"   ... and {len(positions_data) - 5} more\n"
-        else:
-            message += "\n📋 <b>All positions are closed.</b>\n"
-
-        return self.send_message(message)
+        message = _PNL_UPDATE_TEMPLATE.format_map({
+            "emoji": emoji,
+            "pnl": pnl,
+            "pnl_status": pnl_status,
+            "stoploss": stoploss,
+            "distance_from_sl": distance_from_sl,
+            "target": target,
+            "distance_from_target": distance_from_target,
+            "time": now.strftime(_TIME_FORMAT),
+            "positions": self._format_positions(positions_data),
+        })
+
+        # PNL updates are informational: hand them to the background sender, keeping only the newest
+        queued = self.queue_message(message, latest_only=True)
+        if queued and skip_unchanged:
+            # Only a message that made it into the queue suppresses identical ones
+            self._last_pnl_update = (signature, sent_at)
+        return queued
     
-    def send_kill_switch_alert(self, reason, pnl, limit_value, kill_switch_enabled=False):
+    def send_kill_switch_alert(self, reason, pnl, limit_value, kill_switch_enabled=False, now=None):
         """Send kill switch activation alert"""
+        if not self.enabled:
+            return False
+
         if reason == "STOPLOSS":
             emoji = "🚨"
             title = "STOPLOSS BREACHED"
@@ -249,176 +527,291 @@ class TelegramNotifier:
 
         if kill_switch_enabled:
             action_title = "KILL SWITCH ACTIVATING!"
-            action_details = """
-<b>Actions being taken:</b>
-1️⃣ Squaring off all positions
-2️⃣ Cancelling all pending orders
-3️⃣ Disabling trading for today
-"""
+            action_details = _KILL_SWITCH_ACTIONS_ENABLED
         else:
             action_title = "CLOSING POSITIONS"
-            action_details = """
-<b>Actions being taken:</b>
-1️⃣ Squaring off all positions
-2️⃣ Cancelling all pending orders
-
-⚠️ <i>Kill Switch activation is disabled.</i>
-"""
-
-        message = f"""
-{emoji}{emoji}{emoji} <b>{title}</b> {emoji}{emoji}{emoji}
-
-{color} <b>P&L:</b> ₹{pnl:,.2f}
-{color} <b>Limit:</b> ₹{limit_value:,.2f}
-
-⚡ <b>{action_title}</b>
-
-{action_details}
-⏰ Time: {datetime.now().strftime('%I:%M:%S %p')}
-📅 Date: {datetime.now().strftime('%d %B %Y')}
-
-🛑 <b>Shutdown in progress...</b>
-"""
+            action_details = _KILL_SWITCH_ACTIONS_DISABLED
+
+        if now is None:
+            now = datetime.now()
+        message = _KILL_SWITCH_ALERT_TEMPLATE.format(
+            emoji=emoji,
+            title=title,
+            color=color,
+            pnl=pnl,
+            limit_value=limit_value,
+            action_title=action_title,
+            action_details=action_details,
+            time=now.strftime(_TIME_FORMAT),
+            date=now.strftime(_DATE_FORMAT),
+        )
         
         return self.send_message(message)
     
     def send_startup_message(self, config):
         """Send script startup notification"""
-        message = f"""
-🤖 <b>Dhan Risk Manager Started</b>
+        if not self.enabled:
+            return False
 
-📊 <b>Configuration:</b>
-   🔴 Stoploss: ₹{config['DAILY_STOPLOSS']:,.2f}
-   🟢 Target: ₹{config['DAILY_TARGET']:,.2f}
-   ⏱ Check Interval: {config['CHECK_INTERVAL_SECONDS']} second(s)
-"""
+        message = _STARTUP_TEMPLATE.format_map(config)
         if config.get("ENABLE_TRAILING_STOPLOSS"):
-            message += f"""
-   🚀 <b>Trailing SL Enabled</b>
-      - Activate at: ₹{config['TRAILING_STOPLOSS_ACTIVATE_PROFIT']:,.2f}
-      - Trail by: {config['TRAILING_STOPLOSS_TRAIL_PERCENT']}%
-"""
+            message += _STARTUP_TRAILING_SECTION.format_map(config)
         
         if config.get("ENABLE_POSITION_PERCENT_TAKE"):
-            message += f"""
-   📈 <b>Per-Position Take-Profit Enabled</b>
-      - Profit Percent: {config['POSITION_PERCENT_TAKE']}%
-"""
+            message += _STARTUP_PERCENT_TAKE_SECTION.format_map(config)
         if config.get("ENABLE_POSITION_PERCENT_STOPLOSS"):
-            message += f"""
-   🛑 <b>Per-Position Stoploss Enabled</b>
-      - Stoploss Percent: {config['POSITION_PERCENT_STOPLOSS']}%
-"""
+            message += _STARTUP_PERCENT_STOPLOSS_SECTION.format_map(config)
 
         if config.get("ENABLE_KILL_SWITCH"):
-            message += """
-   ✅ <b>Kill Switch Activation Enabled</b>
-"""
+            message += _STARTUP_KILL_SWITCH_SECTION
 
-        message += f"""
-🕐 Market Hours: {config['MARKET_START_TIME']} - {config['MARKET_END_TIME']}
-📅 Run Days: {config.get('RUN_DAYS', 'WEEKDAYS')}
-
-✅ Monitoring active
-⏰ Started: {datetime.now().strftime('%I:%M:%S %p')}
-"""
+        message += _STARTUP_FOOTER_TEMPLATE.format(
+            MARKET_START_TIME=config['MARKET_START_TIME'],
+            MARKET_END_TIME=config['MARKET_END_TIME'],
+            run_days=config.get('RUN_DAYS', 'WEEKDAYS'),
+            time=datetime.now().strftime(_TIME_FORMAT),
+        )
         return self.send_message(message)
     
-    def send_error_alert(self, error_message):
-        """Send error notification"""
-        message = f"""
-⚠️ <b>Error Alert</b>
+    def send_error_alert(self, error_message, blocking=False):
+        """Send error notification (`blocking` sends it before returning, e.g. right before sys.exit)"""
+        if not self.enabled:
+            return False
 
-❌ {error_message}
+        message = _ERROR_ALERT_TEMPLATE.format(
+            error_message=error_message,
+            time=datetime.now().strftime(_TIME_FORMAT),
+        )
+        if blocking:
+            # The daemon sender thread dies with the process, so a final alert cannot be queued
+            return self.send_message(message)
+        return self.queue_message(message)
 
-⏰ Time: {datetime.now().strftime('%I:%M:%S %p')}
+# ============================================================================
+# POSITION MODEL
+# ============================================================================
 
-⚠️ Please check the logs or system
-"""
-        return self.send_message(message)
+# Average-price fields to try, in priority order (includes Dhan's buyAvg and costPrice)
+_PRICE_KEYS = (
+    'averagePrice', 'avgPrice', 'avg_price', 'average_price',
+    'entryPrice', 'entry_price', 'buyAvg', 'costPrice',
+)
+_PRICE_KEYS_SET = frozenset(_PRICE_KEYS)
+
+@dataclass(slots=True)
+class Position:
+    """A Dhan position with its numeric fields parsed once at fetch time"""
+    symbol: str
+    realized: float
+    unrealized: float
+    total: float
+    net_qty: int | None  # None if the API sent a netQty that is not a number
+    avg_price: float | None  # First usable average-price field, None if the API sent none
+    position_data: dict  # Full position data from the API, used for squaring off
+
+    @staticmethod
+    def _parse_avg_price(position):
+        """Return the first non-empty, numeric average-price field in _PRICE_KEYS priority order"""
+        # One set intersection finds the candidates present; only those are tried
+        for key in sorted(_PRICE_KEYS_SET & position.keys(), key=_PRICE_KEYS.index):
+            val = position[key]
+            if val is not None and val != "":
+                try:
+                    return float(val)
+                except (TypeError, ValueError):
+                    continue
+        return None
+
+    @classmethod
+    def from_api(cls, position):
+        realized = float(position.get('realizedProfit', 0))
+        unrealized = float(position.get('unrealizedProfit', 0))
+        try:
+            net_qty = int(position.get('netQty') or 0)
+        except (TypeError, ValueError):
+            # Keep it visible: an unknown quantity must not pass for a flat position
+            net_qty = None
+        return cls(
+            symbol=position.get('tradingSymbol', 'N/A'),
+            realized=realized,
+            unrealized=unrealized,
+            total=realized + unrealized,
+            net_qty=net_qty,
+            avg_price=cls._parse_avg_price(position),
+            position_data=position,
+        )
+
+# ============================================================================
+# RISK SETTINGS
+# ============================================================================
+
+@dataclass(slots=True, frozen=True)
+class RiskConfig:
+    """Risk settings consulted on every check, coerced once from the CONFIG dict"""
+    daily_stoploss: float
+    daily_target: float
+    enable_trailing_stoploss: bool
+    trailing_activate_profit: float
+    trailing_trail_percent: float
+    send_pnl_updates: bool
+    position_percent_take: float  # 0 disables the per-position take-profit check
+    position_percent_stoploss: float  # 0 disables the per-position stoploss check
+    kill_switch_enabled: bool
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            daily_stoploss=float(config["DAILY_STOPLOSS"]),
+            daily_target=float(config["DAILY_TARGET"]),
+            enable_trailing_stoploss=bool(config.get("ENABLE_TRAILING_STOPLOSS")),
+            trailing_activate_profit=float(config.get("TRAILING_STOPLOSS_ACTIVATE_PROFIT") or 0.0),
+            trailing_trail_percent=float(config.get("TRAILING_STOPLOSS_TRAIL_PERCENT") or 0.0),
+            send_pnl_updates=bool(config.get("EFFECTIVE_SEND_PNL_UPDATES")) and not config.get("SEND_ONLY_ALERTS"),
+            position_percent_take=(
+                float(config.get("POSITION_PERCENT_TAKE") or 0.0) if config.get("ENABLE_POSITION_PERCENT_TAKE") else 0.0
+            ),
+            position_percent_stoploss=(
+                float(config.get("POSITION_PERCENT_STOPLOSS") or 0.0) if config.get("ENABLE_POSITION_PERCENT_STOPLOSS") else 0.0
+            ),
+            kill_switch_enabled=bool(config.get("ENABLE_KILL_SWITCH")),
+        )
 
 # ============================================================================
 # DHAN API CLASS
 # ============================================================================
 
+# Position fields every square-off order needs; extracted in one call, KeyError if any is absent
+_ORDER_FIELDS = itemgetter('exchangeSegment', 'productType', 'securityId')
+
 class DhanRiskManager:
+    # Upper bound on concurrent order/cancel requests during a square-off
+    MAX_PARALLEL_REQUESTS = 8
+
+    # Endpoint paths, appended to base_url (which has no trailing slash)
+    POSITIONS_PATH = "/positions"
+    ORDERS_PATH = "/orders"
+    KILL_SWITCH_PATH = "/killSwitch"
+
+    # Jobs that fall due together (risk check, periodic PNL) share one positions fetch within this window
+    POSITIONS_CACHE_TTL = 0.5
+
+    # Fields shared by every square-off order; read-only so no caller can mutate it by accident
+    SQUARE_OFF_ORDER_TEMPLATE = MappingProxyType({
+        "orderType": "MARKET",
+        "validity": "DAY",
+        "disclosedQuantity": "",
+        "price": "",
+        "triggerPrice": "",
+        "afterMarketOrder": False,
+    })
+
     def __init__(self, config, telegram_notifier=None):
         self.access_token = config["ACCESS_TOKEN"]
-        self.daily_stoploss = config["DAILY_STOPLOSS"]
-        self.daily_target = config["DAILY_TARGET"]
-        self.base_url = "https://api.dhan.co/"
+        # Settings resolved once from the config this manager was built with
+        self.settings = RiskConfig.from_config(config)
+        # The stoploss moves with the trailing stoploss; the target is fixed for the day
+        self.daily_stoploss = self.settings.daily_stoploss
+        self.daily_target = self.settings.daily_target
+        self.base_url = "https://api.dhan.co"
+        # Endpoint URLs built once; the access-token header lives on the session below
+        self.positions_url = self.base_url + self.POSITIONS_PATH
+        self.orders_url = self.base_url + self.ORDERS_PATH
+        self.kill_switch_url = self.base_url + self.KILL_SWITCH_PATH
         self.headers = {
             "access-token": self.access_token,
             "Content-Type": "application/json"
         }
+        # Persistent HTTP session: keeps the TCP/TLS connection to Dhan alive across checks
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Retry rate limiting (429) and transient gateway errors with a short exponential backoff
+        # (under a second in total). Retry-After is ignored: the breach path (fetch orders, cancels) must not
+        # sleep for however long the server asks. urllib3 only retries idempotent methods
+        # (GET/DELETE) on read errors/bad statuses, so order placement and kill-switch POSTs are never re-sent.
+        retry = Retry(
+            total=3,
+            backoff_factor=0.1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        # Pool must hold one connection per concurrent square-off/cancel worker
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.MAX_PARALLEL_REQUESTS, max_retries=retry))
         self.kill_switch_triggered = False
         self.telegram = telegram_notifier
         self.dhan_client_id = None  # Will be fetched from positions API
+        self._positions_cache = None  # (monotonic fetch time, get_positions_pnl result)
         
-    def get_positions_pnl(self):
-        """Fetch current positions and calculate total PNL"""
-        url = f"{self.base_url}/positions"
-        
+    def _call(self, method, url, action, **kwargs):
+        """Send a Dhan API request and handle transport errors in one place.
+
+        Returns (status_code, body): body is the parsed JSON on HTTP 200 and the
+        response text otherwise. status_code is None if the request itself failed,
+        in which case body is the error description.
+        """
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            
+            response = self.session.request(method, url, timeout=10, **kwargs)
             if response.status_code == 200:
-                data = response.json()
-                
-                if not data:
-                    logging.info("No open positions found")
-                    # Return a consistent tuple: (pnl, position_details)
-                    return 0, []
-                
-                # Extract client ID from first position
-                if data and not self.dhan_client_id:
-                    self.dhan_client_id = data[0].get('dhanClientId')
-                
-                total_pnl = 0
-                position_details = []
-                
-                for position in data:
-                    realized_pnl = float(position.get('realizedProfit', 0))
-                    unrealized_pnl = float(position.get('unrealizedProfit', 0))
-                    position_pnl = realized_pnl + unrealized_pnl
-                    total_pnl += position_pnl
-                    
-                    position_details.append({
-                        'symbol': position.get('tradingSymbol', 'N/A'),
-                        'realized': realized_pnl,
-                        'unrealized': unrealized_pnl,
-                        'total': position_pnl,
-                        'position_data': position  # Store full position data for squaring off
-                    })
-                
-                # Log position details
-                logging.info("=" * 70)
-                logging.info("CURRENT POSITIONS:")
-                for pos in position_details:
-                    logging.info(f"  {pos['symbol']}: Realized=₹{pos['realized']:.2f}, "
-                               f"Unrealized=₹{pos['unrealized']:.2f}, Total=₹{pos['total']:.2f}")
-                logging.info("=" * 70)
-                logging.info(f"TOTAL DAY P&L: ₹{total_pnl:.2f}")
-                logging.info("=" * 70)
-                
-                return total_pnl, position_details
-                
-            elif response.status_code == 401:
-                logging.error("Authentication failed. Please check your ACCESS_TOKEN")
-                return None, "ACCESS_TOKEN_INVALID"
-            else:
-                logging.error(f"Error fetching positions: {response.status_code} - {response.text}")
-                return None, None
-                
+                return 200, response.json()
+            logging.error(f"{action} failed: {response.status_code} - {response.text}")
+            return response.status_code, response.text
         except requests.exceptions.Timeout:
-            logging.error("Request timed out while fetching positions")
-            return None, None
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Network error in get_positions_pnl: {e}")
+            logging.error(f"{action} timed out")
+            return None, "Request timed out"
+        except Exception as e:
+            logging.error(f"{action} failed: {e}")
+            return None, str(e)
+
+    def get_positions_pnl(self):
+        """Fetch current positions and calculate total PNL (reusing a result fetched moments ago)"""
+        cached = self._positions_cache
+        if cached is not None and time.monotonic() - cached[0] < self.POSITIONS_CACHE_TTL:
+            return cached[1]
+
+        result = self._fetch_positions_pnl()
+        # Only successful fetches are cached, so errors are retried on the next call
+        if result[0] is not None:
+            self._positions_cache = (time.monotonic(), result)
+        return result
+
+    def _fetch_positions_pnl(self):
+        """Fetch current positions from Dhan and calculate total PNL"""
+        status, data = self._call("GET", self.positions_url, "Fetching positions")
+
+        if status == 401:
+            logging.error("Authentication failed. Please check your ACCESS_TOKEN")
+            return None, "ACCESS_TOKEN_INVALID"
+        if status != 200:
             return None, None
+
+        if not data:
+            logging.info("No open positions found")
+            # Return a consistent tuple: (pnl, position_details)
+            return 0, []
+
+        try:
+            # Extract client ID from first position
+            if not self.dhan_client_id:
+                self.dhan_client_id = data[0].get('dhanClientId')
+
+            # Parse each position once; downstream code uses typed attributes
+            position_details = [Position.from_api(position) for position in data]
+            total_pnl = sum(pos.total for pos in position_details)
         except Exception as e:
             logging.error(f"Unexpected error in get_positions_pnl: {e}")
             return None, None
+
+        # Log position details as one record (skipped entirely, formatting included, when INFO is disabled)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            lines = [_BAR, "CURRENT POSITIONS:"]
+            lines.extend(
+                f"  {pos.symbol}: Realized=₹{pos.realized:.2f}, Unrealized=₹{pos.unrealized:.2f}, Total=₹{pos.total:.2f}"
+                for pos in position_details
+            )
+            lines += [_BAR, f"TOTAL DAY P&L: ₹{total_pnl:.2f}", _BAR]
+            logging.info("\n".join(lines))
+
+        return total_pnl, position_details
     
     def square_off_all_positions(self, position_details):
         """Square off all open positions by placing opposite orders"""
@@ -426,125 +819,97 @@ class DhanRiskManager:
             logging.info("No positions to square off")
             return True
         
-        logging.warning("=" * 70)
+        logging.warning(_BAR)
         logging.warning("SQUARING OFF ALL POSITIONS")
-        logging.warning("=" * 70)
-        
-        squared_off_count = 0
-        failed_count = 0
+        logging.warning(_BAR)
         
+        # Flat positions need no order and do not count towards the summary
+        to_close = []
         for pos in position_details:
-            try:
-                position_data = pos['position_data']
-                net_qty = int(position_data.get('netQty', 0))
-                
-                if net_qty == 0:
-                    logging.info(f"  ✓ {pos['symbol']}: No net position to square off")
-                    continue
-                
-                # Determine transaction type (opposite of current position)
-                transaction_type = "SELL" if net_qty > 0 else "BUY"
-                quantity = abs(net_qty)
-                
-                # Prepare order payload
-                order_payload = {
-                    "dhanClientId": self.dhan_client_id or position_data.get('dhanClientId'),
-                    "transactionType": transaction_type,
-                    "exchangeSegment": position_data.get('exchangeSegment'),
-                    "productType": position_data.get('productType'),
-                    "orderType": "MARKET",
-                    "validity": "DAY",
-                    "securityId": position_data.get('securityId'),
-                    "quantity": str(quantity),
-                    "disclosedQuantity": "",
-                    "price": "",
-                    "triggerPrice": "",
-                    "afterMarketOrder": False
-                }
-                
-                # Place square off order
-                url = f"{self.base_url}/orders"
-                response = requests.post(url, headers=self.headers, json=order_payload, timeout=10)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logging.warning(f"  ✓ {pos['symbol']}: Squared off {quantity} qty "
-                                  f"({transaction_type}) - Order ID: {result.get('orderId')}")
-                    squared_off_count += 1
-                else:
-                    logging.error(f"  ✗ {pos['symbol']}: Failed to square off - {response.text}")
-                    failed_count += 1
-                    
-            except Exception as e:
-                logging.error(f"  ✗ {pos['symbol']}: Exception - {e}")
-                failed_count += 1
+            if pos.net_qty == 0:
+                logging.info(f"  ✓ {pos.symbol}: No net position to square off")
+            else:
+                to_close.append(pos)
+        if not to_close:
+            logging.warning("Square Off Summary: no open positions")
+            return True
+
+        # Orders are independent, so fan them out instead of paying one round-trip per position
+        with ThreadPoolExecutor(max_workers=min(self.MAX_PARALLEL_REQUESTS, len(to_close))) as executor:
+            results = list(executor.map(self.square_off_position, to_close))
+
+        squared_off_count = results.count(True)
+        failed_count = len(results) - squared_off_count
         
-        logging.warning("=" * 70)
+        logging.warning(_BAR)
         logging.warning(f"Square Off Summary: {squared_off_count} successful, {failed_count} failed")
-        logging.warning("=" * 70)
+        logging.warning(_BAR)
         
         return failed_count == 0
 
     def square_off_position(self, pos):
         """Square off a single position by placing an opposite market order."""
         try:
-            position_data = pos['position_data']
-            net_qty = int(position_data.get('netQty', 0))
+            position_data = pos.position_data
+            net_qty = pos.net_qty
 
             if net_qty == 0:
-                logging.info(f"  ✓ {pos['symbol']}: No net position to square off")
+                logging.info(f"  ✓ {pos.symbol}: No net position to square off")
                 return True
+            if net_qty is None:
+                logging.error("  ✗ %s: Cannot square off, netQty %r is not a number",
+                              pos.symbol, position_data.get('netQty'))
+                return False
+
+            # Refuse to send an order Dhan would reject anyway for lack of instrument details
+            try:
+                exchange_segment, product_type, security_id = _ORDER_FIELDS(position_data)
+            except KeyError as e:
+                logging.error("  ✗ %s: Cannot square off, position data is missing %s", pos.symbol, e)
+                return False
+            if not (exchange_segment and product_type and security_id):
+                logging.error("  ✗ %s: Cannot square off, position data has empty order fields", pos.symbol)
+                return False
 
             transaction_type = "SELL" if net_qty > 0 else "BUY"
             quantity = abs(net_qty)
 
             order_payload = {
+                **self.SQUARE_OFF_ORDER_TEMPLATE,
                 "dhanClientId": self.dhan_client_id or position_data.get('dhanClientId'),
                 "transactionType": transaction_type,
-                "exchangeSegment": position_data.get('exchangeSegment'),
-                "productType": position_data.get('productType'),
-                "orderType": "MARKET",
-                "validity": "DAY",
-                "securityId": position_data.get('securityId'),
+                "exchangeSegment": exchange_segment,
+                "productType": product_type,
+                "securityId": security_id,
                 "quantity": str(quantity),
-                "disclosedQuantity": "",
-                "price": "",
-                "triggerPrice": "",
-                "afterMarketOrder": False
             }
 
-            url = f"{self.base_url}/orders"
-            response = requests.post(url, headers=self.headers, json=order_payload, timeout=10)
-
-            if response.status_code == 200:
-                result = response.json()
-                logging.warning(f"  ✓ {pos['symbol']}: Squared off {quantity} qty ({transaction_type}) - Order ID: {result.get('orderId')}")
-                return True
-            else:
-                logging.error(f"  ✗ {pos['symbol']}: Failed to square off - {response.text}")
+            # Positions are about to change, and even a failed or timed-out order may have executed:
+            # the next read must hit the API whatever the outcome
+            self._positions_cache = None
+            status, result = self._call("POST", self.orders_url, f"  ✗ {pos.symbol}: Square off", json=order_payload)
+            if status != 200:
                 return False
 
+            logging.warning(f"  ✓ {pos.symbol}: Squared off {quantity} qty ({transaction_type}) - Order ID: {result.get('orderId')}")
+            return True
+
         except Exception as e:
-            logging.error(f"  ✗ {pos['symbol']}: Exception during square off - {e}")
+            logging.error(f"  ✗ {pos.symbol}: Exception during square off - {e}")
             return False
     
     def cancel_all_pending_orders(self):
         """Cancel all pending orders"""
-        logging.warning("=" * 70)
+        logging.warning(_BAR)
         logging.warning("CANCELLING ALL PENDING ORDERS")
-        logging.warning("=" * 70)
+        logging.warning(_BAR)
         
         try:
             # Get all orders
-            url = f"{self.base_url}/orders"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            
-            if response.status_code != 200:
-                logging.error(f"Failed to fetch orders: {response.text}")
+            status, orders = self._call("GET", self.orders_url, "Fetching orders")
+            if status != 200:
                 return False
             
-            orders = response.json()
-            
             if not orders:
                 logging.info("  No pending orders found")
                 return True
@@ -559,32 +924,15 @@ class DhanRiskManager:
                 logging.info("  No pending orders to cancel")
                 return True
             
-            cancelled_count = 0
-            failed_count = 0
-            
-            for order in pending_orders:
-                try:
-                    order_id = order.get('orderId')
-                    symbol = order.get('tradingSymbol', 'N/A')
-                    
-                    # Cancel order
-                    cancel_url = f"{self.base_url}/orders/{order_id}"
-                    cancel_response = requests.delete(cancel_url, headers=self.headers, timeout=10)
-                    
-                    if cancel_response.status_code == 200:
-                        logging.warning(f"  ✓ Cancelled: {symbol} - Order ID: {order_id}")
-                        cancelled_count += 1
-                    else:
-                        logging.error(f"  ✗ Failed to cancel: {symbol} - {cancel_response.text}")
-                        failed_count += 1
-                        
-                except Exception as e:
-                    logging.error(f"  ✗ Exception cancelling order {order_id}: {e}")
-                    failed_count += 1
+            with ThreadPoolExecutor(max_workers=min(self.MAX_PARALLEL_REQUESTS, len(pending_orders))) as executor:
+                results = list(executor.map(self._cancel_order, pending_orders))
+
+            cancelled_count = results.count(True)
+            failed_count = len(results) - cancelled_count
             
-            logging.warning("=" * 70)
+            logging.warning(_BAR)
             logging.warning(f"Cancellation Summary: {cancelled_count} successful, {failed_count} failed")
-            logging.warning("=" * 70)
+            logging.warning(_BAR)
             
             return failed_count == 0
             
@@ -592,53 +940,59 @@ class DhanRiskManager:
             logging.error(f"Exception in cancel_all_pending_orders: {e}")
             return False
     
+    def _cancel_order(self, order):
+        """Cancel a single pending order. Returns True on success."""
+        order_id = order.get('orderId')
+        symbol = order.get('tradingSymbol', 'N/A')
+
+        status, _ = self._call("DELETE", f"{self.orders_url}/{order_id}", f"  ✗ Cancel {symbol} (Order ID: {order_id})")
+        if status != 200:
+            return False
+
+        logging.warning(f"  ✓ Cancelled: {symbol} - Order ID: {order_id}")
+        return True
+    
     def trigger_kill_switch(self, position_details):
         """Trigger the kill switch to disable trading for the day"""
         # Note: Kill Switch requires all positions to be closed and no pending orders
         # It only disables trading, doesn't automatically square off positions
-        url = f"{self.base_url}/killSwitch"
-        
+
         # Add query parameter for activation
         params = {"killSwitchStatus": "ACTIVATE"}
         
-        try:
-            logging.warning("🔴 INITIATING KILL SWITCH... 🔴")
-            logging.warning("Note: Ensure all positions are closed and no pending orders exist")
-            
-            response = requests.post(url, headers=self.headers, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                client_id = result.get('dhanClientId', 'N/A')
-                kill_switch_status = result.get('killSwitchStatus', 'N/A')
-                logging.warning("=" * 70)
-                logging.warning("=" * 70)
-                if "activated" in str.lower(kill_switch_status):
-                    logging.warning("🔴 KILL SWITCH ACTIVATED SUCCESSFULLY! 🔴")
-                    logging.warning("Trading disabled for the current trading day")
-                    logging.warning(f"Client ID: {client_id}")
-                    logging.warning(f"Status: {kill_switch_status}")
-                    self.kill_switch_triggered = True
-                    return [True, kill_switch_status]
-                else:
-                    logging.error(f"Kill switch activation failed: {kill_switch_status}")
-                    logging.error(f"Client ID: {client_id}")
-                    logging.error(f"Status: {kill_switch_status}")
-                    return [False, kill_switch_status]
-            else:
-                logging.error(f"Failed to trigger kill switch: {response.status_code}")
-                logging.error(f"Response: {response.text}")
-                return [False, response.text]
-
-        except requests.exceptions.Timeout:
-            logging.error("Request timed out while triggering kill switch")
-            return [False, "Request timed out"]
-        except Exception as e:
-            logging.error(f"Exception in trigger_kill_switch: {e}")
-            return [False, str(e)]
+        logging.warning("🔴 INITIATING KILL SWITCH... 🔴")
+        logging.warning("Note: Ensure all positions are closed and no pending orders exist")
+
+        status, result = self._call("POST", self.kill_switch_url, "Kill switch activation", params=params)
+        if status != 200:
+            return [False, result]
+        if not isinstance(result, dict):
+            # Must not raise: an exception here would end the process right after a breach
+            logging.error(f"Kill switch activation returned an unexpected response: {result!r}")
+            return [False, f"Unexpected response: {result!r}"]
+
+        client_id = result.get('dhanClientId', 'N/A')
+        kill_switch_status = result.get('killSwitchStatus', 'N/A')
+        logging.warning(_BAR)
+        logging.warning(_BAR)
+        # Status may be missing or non-string in an unexpected response; compare case-insensitively
+        if "activated" in str(kill_switch_status or "").casefold():
+            logging.warning("🔴 KILL SWITCH ACTIVATED SUCCESSFULLY! 🔴")
+            logging.warning("Trading disabled for the current trading day")
+            logging.warning(f"Client ID: {client_id}")
+            logging.warning(f"Status: {kill_switch_status}")
+            self.kill_switch_triggered = True
+            return [True, kill_switch_status]
+        else:
+            logging.error(f"Kill switch activation failed: {kill_switch_status}")
+            logging.error(f"Client ID: {client_id}")
+            logging.error(f"Status: {kill_switch_status}")
+            return [False, kill_switch_status]
     
-    def check_and_manage_risk(self):
+    def check_and_manage_risk(self, now=None):
         """Check PNL against limits and trigger kill switch if breached"""
+        if now is None:
+            now = datetime.now()
         
         if self.kill_switch_triggered:
             logging.info("Kill switch already triggered. Skipping check.")
@@ -652,7 +1006,7 @@ class DhanRiskManager:
             
             if self.telegram:
                 if error_reason == "ACCESS_TOKEN_INVALID":
-                    self.telegram.send_error_alert("⛔ <b>CRITICAL ERROR:</b> Access Token Invalid.\n\n🛑 Script is terminating.")
+                    self.telegram.send_error_alert("⛔ <b>CRITICAL ERROR:</b> Access Token Invalid.\n\n🛑 Script is terminating.", blocking=True)
                     logging.critical("Terminating script due to invalid access token.")
                     sys.exit(5) # Exit code 5: Do not restart
                 else:
@@ -664,14 +1018,14 @@ class DhanRiskManager:
         
         pnl, position_details = result
         
-        logging.info(f"Risk Check: P&L=₹{pnl:.2f} | "
-                    f"Stoploss=₹{self.daily_stoploss:.2f} | "
-                    f"Target=₹{self.daily_target:.2f}")
+        # Runs every tick: let logging format the values only if INFO is enabled
+        logging.info("Risk Check: P&L=₹%.2f | Stoploss=₹%.2f | Target=₹%.2f",
+                     pnl, self.daily_stoploss, self.daily_target)
 
         # Trailing Stoploss Logic
-        if CONFIG.get("ENABLE_TRAILING_STOPLOSS") and pnl > 0:
-            activation_profit = float(CONFIG.get("TRAILING_STOPLOSS_ACTIVATE_PROFIT", 0.0))
-            trail_percent = float(CONFIG.get("TRAILING_STOPLOSS_TRAIL_PERCENT", 0.0))
+        if self.settings.enable_trailing_stoploss and pnl > 0:
+            activation_profit = self.settings.trailing_activate_profit
+            trail_percent = self.settings.trailing_trail_percent
 
             if activation_profit > 0 and trail_percent > 0 and pnl >= activation_profit:
                 # Calculate new potential stoploss
@@ -683,119 +1037,30 @@ class DhanRiskManager:
                     self.daily_stoploss = new_trailing_stoploss
                     logging.warning(f"🚀 TRAILING STOPLOSS UPDATED: New SL=₹{self.daily_stoploss:.2f} (was ₹{old_sl:.2f}) | Current PNL=₹{pnl:.2f}")
                     
-                    # Notify via Telegram
+                    # Notify via Telegram (queued: the risk check does not wait on the send)
                     if self.telegram:
                         try:
                             msg = f"🚀 <b>Trailing Stoploss Updated</b>\n\nNew SL: ₹{self.daily_stoploss:,.2f}\nPNL: ₹{pnl:,.2f}"
-                            self.telegram.send_message(msg)
+                            self.telegram.queue_message(msg)
                         except Exception as e:
                             logging.error(f"Failed to send Telegram trailing SL update: {e}")
         
         # Send PNL update to Telegram if enabled and effective send flag is true.
         if (
             self.telegram
-            and CONFIG.get("EFFECTIVE_SEND_PNL_UPDATES", False)
-            and not CONFIG["SEND_ONLY_ALERTS"]
+            and self.settings.send_pnl_updates
         ):
-            # Get position details for telegram message
-            positions_data = self._get_positions_for_telegram()
-            self.telegram.send_pnl_update(pnl, self.daily_stoploss, self.daily_target, positions_data)
+            # Reuse the positions already fetched for this check (no second /positions call)
+            positions_data = self._get_positions_for_telegram(position_details)
+            self.telegram.send_pnl_update(pnl, self.daily_stoploss, self.daily_target, positions_data, now=now)
 
         # Per-position percent-based profit-taking
         try:
-            if CONFIG.get("ENABLE_POSITION_PERCENT_TAKE") and CONFIG.get("POSITION_PERCENT_TAKE", 0) > 0:
-                threshold_pct = float(CONFIG.get("POSITION_PERCENT_TAKE", 0.0))
-                logging.info(f"Checking per-position percent-take threshold: {threshold_pct}%")
-                positions_to_square = []
-
-                for pos in position_details:
-                    pos_data = pos.get('position_data', {})
-                    try:
-                        net_qty = int(pos_data.get('netQty', 0))
-                    except Exception:
-                        net_qty = 0
-
-                    if net_qty == 0:
-                        continue
-
-                    # Try common average price keys (include Dhan's fields like buyAvg and costPrice)
-                    avg_price = None
-                    for key in (
-                        'averagePrice', 'avgPrice', 'avg_price', 'average_price',
-                        'entryPrice', 'entry_price', 'buyAvg', 'costPrice'
-                    ):
-                        val = pos_data.get(key)
-                        if val is not None and val != "":
-                            try:
-                                avg_price = float(val)
-                                break
-                            except Exception:
-                                continue
-
-                    if not avg_price or avg_price == 0:
-                        # Log as INFO so it's visible in normal runs and include position keys for debugging
-                        try:
-                            keys = list(pos_data.keys())
-                        except Exception:
-                            keys = None
-                        logging.info(f"Skipping percent check for {pos.get('symbol')} due to missing/zero avg price; keys={keys}")
-                        continue
-
-                    invested_value = abs(net_qty) * avg_price
-                    if invested_value == 0:
-                        continue
-
-                    position_pnl = pos.get('total', 0)
-                    try:
-                        percent = (position_pnl / invested_value) * 100
-                    except Exception:
-                        percent = 0
-
-                    logging.info(f"{pos.get('symbol')}: P&L=₹{position_pnl:.2f} | Invested=₹{invested_value:.2f} | Percent={percent:.2f}%")
-                    # Additional debug info to help troubleshoot live discrepancies
-                    try:
-                        logging.info(f"  -> position_data keys: {list(pos_data.keys())}")
-                    except Exception:
-                        logging.info("  -> position_data keys: <unable to list keys>")
-                    logging.info(f"  -> avg_price detected: {avg_price}")
-                    logging.info(f"  -> net_qty: {net_qty}")
-                    logging.info(f"  -> invested_value: {invested_value}")
-                    logging.info(f"  -> computed percent: {percent:.4f} | threshold_pct: {threshold_pct}")
-
-                    # Check for profit-taking
-                    if percent >= threshold_pct:
-                        positions_to_square.append((pos, percent, 'TAKE_PROFIT'))
-
-                    # Check for per-position stoploss (negative percent)
-                    stoploss_pct = float(CONFIG.get('POSITION_PERCENT_STOPLOSS', 0.0))
-                    if CONFIG.get('ENABLE_POSITION_PERCENT_STOPLOSS') and stoploss_pct > 0:
-                        # percent is positive for profit, negative for loss
-                        if percent <= -abs(stoploss_pct):
-                            positions_to_square.append((pos, percent, 'POSITION_STOPLOSS'))
-
-                # Square off identified positions
-                if positions_to_square:
-                    for p, pct, reason in positions_to_square:
-                        sym = p.get('symbol')
-                        if reason == 'TAKE_PROFIT':
-                            logging.warning(f"Position percent threshold met for {sym}: {pct:.2f}% >= {threshold_pct}% — squaring off (TAKE PROFIT)")
-                        else:
-                            logging.warning(f"Position percent stoploss met for {sym}: {pct:.2f}% <= -{stoploss_pct:.2f}% — squaring off (POSITION STOPLOSS)")
-
-                        success = self.square_off_position(p)
-                        logging.info(f"  -> square_off_position returned: {success}")
-
-                        # Notify via Telegram (simple message)
-                        if self.telegram:
-                            try:
-                                if reason == 'TAKE_PROFIT':
-                                    msg = f"⚡ Per-position profit target reached for <b>{sym}</b> — {pct:.2f}% ≥ {threshold_pct}%\nSquaring off {abs(int(p['position_data'].get('netQty',0)))} qty."
-                                else:
-                                    msg = f"⚠️ Per-position stoploss triggered for <b>{sym}</b> — {pct:.2f}% ≤ -{stoploss_pct:.2f}%\nSquaring off {abs(int(p['position_data'].get('netQty',0)))} qty."
-                                self.telegram.send_message(msg)
-                            except Exception as e:
-                                logging.error(f"Failed to send Telegram per-position message: {e}")
-
+            if self.settings.position_percent_take > 0:
+                # Only positions with a net quantity can hit a percent threshold; skip the pass entirely if none do
+                open_positions = [pos for pos in position_details if pos.net_qty != 0]
+                if open_positions:
+                    self._evaluate_percent_thresholds(open_positions)
         except Exception as e:
             logging.error(f"Error during per-position percent checks: {e}")
         
@@ -806,18 +1071,19 @@ class DhanRiskManager:
             # Send Telegram alert before taking action
             if self.telegram:
                 try:
-                    kill_switch_enabled = CONFIG.get("ENABLE_KILL_SWITCH", False)
                     logging.info("Attempting to send Telegram alert (STOPLOSS)")
-                    sent = self.telegram.send_kill_switch_alert("STOPLOSS", pnl, self.daily_stoploss, kill_switch_enabled)
+                    sent = self.telegram.send_kill_switch_alert("STOPLOSS", pnl, self.daily_stoploss, self.settings.kill_switch_enabled, now=now)
                     logging.info(f"Telegram alert (STOPLOSS) sent: {sent}")
                 except Exception as e:
                     logging.error(f"Exception while sending Telegram alert: {e}")
             
+            exit_started = time.perf_counter()
             self.cancel_all_pending_orders()
             self.square_off_all_positions(position_details)
+            logging.warning(f"Cancel + square-off completed in {(time.perf_counter() - exit_started) * 1000:.0f} ms")
             
             # Conditionally trigger kill switch
-            if CONFIG.get("ENABLE_KILL_SWITCH"):
+            if self.settings.kill_switch_enabled:
                 kill_switch_result = self.trigger_kill_switch(position_details)
                 if kill_switch_result[0]:
                     # Send confirmation that kill switch was activated
@@ -825,7 +1091,7 @@ class DhanRiskManager:
                         try:
                             logging.info("Sending Telegram confirmation: kill-switch ACTIVATED (STOPLOSS)")
                             conf_msg = f"🔴 <b>Kill Switch Activated</b> (STOPLOSS)\nP&L: ₹{pnl:,.2f}\nStatus: {kill_switch_result[1]}"
-                            self.telegram.send_message(conf_msg)
+                            self.telegram.queue_message(conf_msg)
                         except Exception as e:
                             logging.error(f"Failed to send kill-switch confirmation message: {e}")
                     return ["STOPLOSS_BREACHED", kill_switch_result[1]]
@@ -843,15 +1109,14 @@ class DhanRiskManager:
             # Send Telegram alert before taking action
             if self.telegram:
                 try:
-                    kill_switch_enabled = CONFIG.get("ENABLE_KILL_SWITCH", False)
                     logging.info("Attempting to send Telegram alert (TARGET)")
-                    sent = self.telegram.send_kill_switch_alert("TARGET", pnl, self.daily_target, kill_switch_enabled)
+                    sent = self.telegram.send_kill_switch_alert("TARGET", pnl, self.daily_target, self.settings.kill_switch_enabled, now=now)
                     logging.info(f"Telegram alert (TARGET) sent: {sent}")
                 except Exception as e:
                     logging.error(f"Exception while sending Telegram alert: {e}")
 
             # Conditionally trigger kill switch
-            if CONFIG.get("ENABLE_KILL_SWITCH"):
+            if self.settings.kill_switch_enabled:
                 kill_switch_result = self.trigger_kill_switch(position_details)
                 if kill_switch_result[0]:
                     # Send confirmation that kill switch was activated
@@ -859,7 +1124,7 @@ class DhanRiskManager:
                         try:
                             logging.info("Sending Telegram confirmation: kill-switch ACTIVATED (TARGET)")
                             conf_msg = f"🟢 <b>Kill Switch Activated</b> (TARGET)\nP&L: ₹{pnl:,.2f}\nStatus: {kill_switch_result[1]}"
-                            self.telegram.send_message(conf_msg)
+                            self.telegram.queue_message(conf_msg)
                         except Exception as e:
                             logging.error(f"Failed to send kill-switch confirmation message: {e}")
                     return ["TARGET_ACHIEVED", kill_switch_result[1]]
@@ -871,57 +1136,169 @@ class DhanRiskManager:
                 return ["TARGET_ACHIEVED", "Kill switch not enabled"]
 
         else:
-            logging.info(f"✓ Within limits. Continue trading.")
+            logging.info("✓ Within limits. Continue trading.")
             return ["WITHIN_LIMITS", "Success"]
 
-    def _get_positions_for_telegram(self):
-        """Helper method to get position data for Telegram messages"""
-        url = f"{self.base_url}/positions"
-        
-        try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                positions = []
-                
-                for position in data:
-                    realized_pnl = float(position.get('realizedProfit', 0))
-                    unrealized_pnl = float(position.get('unrealizedProfit', 0))
-                    
-                    status = ''
-                    # If a position has a non-zero unrealizedProfit, consider it open.
-                    if unrealized_pnl != 0:
-                        status = 'OPEN'
-                    # If position has positive 'realizedProfit' and 0 'unrealizedProfit', consider it closed.
-                    elif realized_pnl > 0 and unrealized_pnl == 0:
-                        status = 'CLOSED'
-
-                    positions.append({
-                        'symbol': position.get('tradingSymbol', 'N/A'),
-                        'realized': realized_pnl,
-                        'unrealized': unrealized_pnl,
-                        'total': realized_pnl + unrealized_pnl,
-                        'status': status
-                    })
-                
-                return positions
-            else:
-                return None
-        except Exception as e:
-            logging.error(f"Error fetching positions for Telegram: {e}")
+    def _evaluate_percent_thresholds(self, open_positions):
+        """Square off open positions whose P&L percent hits the per-position take-profit or stoploss"""
+        threshold_pct = self.settings.position_percent_take
+        stoploss_pct = self.settings.position_percent_stoploss
+        check_position_stoploss = stoploss_pct > 0
+        logging.info("Checking per-position percent-take threshold: %s%%", threshold_pct)
+        positions_to_square = []
+        root_logger = logging.getLogger()
+        info_enabled = root_logger.isEnabledFor(logging.INFO)
+        debug_enabled = root_logger.isEnabledFor(logging.DEBUG)
+
+        for pos in open_positions:
+            pos_data = pos.position_data
+            net_qty = pos.net_qty
+            if net_qty is None:
+                logging.warning("Skipping percent check for %s: netQty %r is not a number",
+                                pos.symbol, pos_data.get('netQty'))
+                continue
+
+            avg_price = pos.avg_price
+            if not avg_price or avg_price == 0:
+                # Log as INFO so it's visible in normal runs and include position keys for debugging
+                if info_enabled:
+                    logging.info("Skipping percent check for %s due to missing/zero avg price; keys=%s",
+                                 pos.symbol, list(pos_data.keys()))
+                continue
+
+            invested_value = abs(net_qty) * avg_price
+            if invested_value == 0:
+                continue
+
+            position_pnl = pos.total
+            try:
+                percent = (position_pnl / invested_value) * 100
+            except Exception:
+                percent = 0
+
+            logging.info("%s: P&L=₹%.2f | Invested=₹%.2f | Percent=%.2f%%",
+                         pos.symbol, position_pnl, invested_value, percent)
+            # Additional debug info to help troubleshoot live discrepancies (one record, DEBUG only)
+            if debug_enabled:
+                logging.debug(
+                    "  -> position_data keys: %s\n"
+                    "  -> avg_price detected: %s\n"
+                    "  -> net_qty: %s\n"
+                    "  -> invested_value: %s\n"
+                    "  -> computed percent: %.4f | threshold_pct: %s",
+                    list(pos_data.keys()), avg_price, net_qty, invested_value, percent, threshold_pct,
+                )
+
+            # Check for profit-taking
+            if percent >= threshold_pct:
+                positions_to_square.append((pos, percent, 'TAKE_PROFIT'))
+
+            # Check for per-position stoploss (negative percent)
+            if check_position_stoploss:
+                # percent is positive for profit, negative for loss
+                if percent <= -abs(stoploss_pct):
+                    positions_to_square.append((pos, percent, 'POSITION_STOPLOSS'))
+
+        # Square off identified positions
+        if positions_to_square:
+            for p, pct, reason in positions_to_square:
+                sym = p.symbol
+                if reason == 'TAKE_PROFIT':
+                    logging.warning(f"Position percent threshold met for {sym}: {pct:.2f}% >= {threshold_pct}% — squaring off (TAKE PROFIT)")
+                else:
+                    logging.warning(f"Position percent stoploss met for {sym}: {pct:.2f}% <= -{stoploss_pct:.2f}% — squaring off (POSITION STOPLOSS)")
+
+                success = self.square_off_position(p)
+                logging.debug("  -> square_off_position returned: %s", success)
+
+                # Notify via Telegram (simple message)
+                if self.telegram:
+                    try:
+                        if reason == 'TAKE_PROFIT':
+                            msg = f"⚡ Per-position profit target reached for <b>{sym}</b> — {pct:.2f}% ≥ {threshold_pct}%\nSquaring off {abs(p.net_qty)} qty."
+                        else:
+                            msg = f"⚠️ Per-position stoploss triggered for <b>{sym}</b> — {pct:.2f}% ≤ -{stoploss_pct:.2f}%\nSquaring off {abs(p.net_qty)} qty."
+                        self.telegram.queue_message(msg)
+                    except Exception as e:
+                        logging.error(f"Failed to send Telegram per-position message: {e}")
+
+    def _get_positions_for_telegram(self, position_details):
+        """Build position summaries for Telegram messages from already-fetched position details"""
+        positions = []
+
+        for pos in position_details:
+            realized_pnl = pos.realized
+            unrealized_pnl = pos.unrealized
+
+            status = ''
+            # If a position has a non-zero unrealizedProfit, consider it open.
+            if unrealized_pnl != 0:
+                status = 'OPEN'
+            # If position has positive 'realizedProfit' and 0 'unrealizedProfit', consider it closed.
+            elif realized_pnl > 0 and unrealized_pnl == 0:
+                status = 'CLOSED'
+
+            positions.append({
+                'symbol': pos.symbol,
+                'realized': realized_pnl,
+                'unrealized': unrealized_pnl,
+                'total': pos.total,
+                'status': status
+            })
+
+        return positions
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+class Scheduler:
+    """Minimal fixed-interval job runner driven by time.monotonic()"""
+
+    def __init__(self):
+        # Min-heap of [next_run, seq, interval_seconds, func]; seq breaks ties in insertion order
+        self.jobs = []
+        self._seq = count()
+
+    def every(self, seconds, func):
+        """Run func every `seconds` seconds, first run one interval from now"""
+        heapq.heappush(self.jobs, [time.monotonic() + seconds, next(self._seq), seconds, func])
+
+    def clear(self):
+        """Remove all scheduled jobs"""
+        self.jobs.clear()
+
+    def idle_seconds(self):
+        """Seconds until the next job is due (None if nothing is scheduled)"""
+        if not self.jobs:
             return None
+        return max(0.0, self.jobs[0][0] - time.monotonic())
+
+    def run_pending(self):
+        """Run every job that is due, earliest first"""
+        now = time.monotonic()
+        while self.jobs and self.jobs[0][0] <= now:
+            job = heapq.heappop(self.jobs)
+            # Advance from the planned time so the cadence does not drift; skip runs missed while busy
+            job[0] += job[2]
+            if job[0] <= now:
+                job[0] = now + job[2]
+            # Re-queue before running so a clear() from inside the job also removes it
+            heapq.heappush(self.jobs, job)
+            job[3]()
 
 # ============================================================================
 # MARKET HOURS CHECK
 # ============================================================================
 
-def is_market_hours():
-    """Check if current time is within market hours"""
-    now_dt = datetime.now()
+def is_market_hours(now_dt=None):
+    """Check if current time (or `now_dt`) is within market hours"""
+    if now_dt is None:
+        now_dt = datetime.now()
     now_time = now_dt.time()
-    start_time = datetime.strptime(CONFIG["MARKET_START_TIME"], "%H:%M").time()
-    end_time = datetime.strptime(CONFIG["MARKET_END_TIME"], "%H:%M").time()
+    # Parsed once in validate_config()
+    start_time = CONFIG["MARKET_START_TIME_PARSED"]
+    end_time = CONFIG["MARKET_END_TIME_PARSED"]
     
     # Check allowed days
     allowed_days = CONFIG.get("ALLOWED_DAYS_SET", set(range(5)))
@@ -929,84 +1306,112 @@ def is_market_hours():
     
     return is_allowed_day and start_time <= now_time <= end_time
 
+def seconds_until_market_open(now_dt=None):
+    """Seconds until the next market session starts (0 while the market is open)"""
+    if now_dt is None:
+        now_dt = datetime.now()
+    if is_market_hours(now_dt):
+        return 0.0
+
+    start_time = CONFIG["MARKET_START_TIME_PARSED"]
+    allowed_days = CONFIG.get("ALLOWED_DAYS_SET", set(range(5)))
+    # Today's session (if it hasn't started yet) or the first allowed day after it
+    for offset in range(8):
+        day = now_dt.date() + timedelta(days=offset)
+        if day.weekday() not in allowed_days:
+            continue
+        session_start = datetime.combine(day, start_time)
+        if session_start > now_dt:
+            return (session_start - now_dt).total_seconds()
+    return 0.0
+
 # ============================================================================
 # MONITORING FUNCTION
 # ============================================================================
 
 risk_manager = None
 telegram_notifier = None
+scheduler = Scheduler()
+# Set by the SIGINT/SIGTERM handler. The handler only flips this flag (it must not take locks);
+# the signal module also writes a byte to the wakeup socket, which ends a pending _wait() at once.
+_shutdown_requested = False
+_wakeup_sockets = None  # (read end, write end), created by _install_signal_handlers()
+
+def _request_shutdown(signum, frame):
+    global _shutdown_requested
+    _shutdown_requested = True
+
+def _install_signal_handlers():
+    """Turn Ctrl+C and `systemctl stop` / `docker stop` into a clean exit between jobs"""
+    global _wakeup_sockets
+    _wakeup_sockets = socket.socketpair()
+    for sock in _wakeup_sockets:
+        sock.setblocking(False)
+    signal.set_wakeup_fd(_wakeup_sockets[1].fileno())
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, _request_shutdown)
+
+def _wait(seconds):
+    """Sleep up to `seconds`, returning early when a stop signal arrives"""
+    if not _shutdown_requested:
+        # A signal delivered after the check above has already written to the socket
+        select.select([_wakeup_sockets[0]], [], [], seconds)
+    try:
+        _wakeup_sockets[0].recv(512)
+    except BlockingIOError:
+        pass
+
+def _stop_monitoring():
+    """Drop every scheduled job after a breach; the process stays up, idle, until it is stopped"""
+    # Not a shutdown: exiting here would let a service manager restart monitoring for the day
+    scheduler.clear()
+    logging.warning("\n🛑 STOPPING MONITORING - KILL SWITCH ACTIVATED 🛑")
+    logging.warning("Script will continue running but no more checks will be performed")
+    logging.warning("You can safely stop the script now (Ctrl+C)")
+    logging.info("Cleared all scheduled jobs due to kill switch activation")
 
 def monitor_risk():
     """Main monitoring function called by scheduler"""
-    global risk_manager, telegram_notifier
-    
-    if not is_market_hours():
+    # One wall-clock read per cycle, shared by the market-hours check, logs and notifications
+    now = datetime.now()
+    if not is_market_hours(now):
         logging.info("Outside market hours. Skipping check.")
         return
     
-    if risk_manager is None:
-        # Initialize Telegram notifier if enabled
-        if CONFIG["TELEGRAM_ENABLED"]:
-            telegram_notifier = TelegramNotifier(
-                bot_token=CONFIG["TELEGRAM_BOT_TOKEN"],
-                chat_id=CONFIG["TELEGRAM_CHAT_ID"],
-                enabled=True
-            )
-        
-        risk_manager = DhanRiskManager(CONFIG, telegram_notifier)
-    
-    logging.info("\n" + "=" * 70)
-    logging.info(f"PNL CHECK at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logging.info("=" * 70)
-    
-    status = risk_manager.check_and_manage_risk()
+    # Runs every tick; the risk check itself logs the P&L line at INFO
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("PNL CHECK at %s", now.strftime('%Y-%m-%d %H:%M:%S'))
+
+    status = risk_manager.check_and_manage_risk(now)
     
     # Stop monitoring if kill switch was triggered
     if status[0] in ["STOPLOSS_BREACHED", "TARGET_ACHIEVED"]:
-        logging.warning("\n🛑 STOPPING MONITORING - KILL SWITCH ACTIVATED 🛑")
-        logging.warning("Script will continue running but no more checks will be performed")
-        logging.warning("You can safely stop the script now (Ctrl+C)")
-        # Clear all scheduled jobs (periodic PNL updates and checks)
-        try:
-            schedule.clear()
-            logging.info("Cleared all scheduled jobs due to kill switch activation")
-        except Exception as e:
-            logging.error(f"Error clearing scheduled jobs: {e}")
-        return schedule.CancelJob
+        _stop_monitoring()
     elif status[0] == "KILL_SWITCH_FAILED":
         logging.error(f"Kill switch activation failed! {status[1]}")
         if telegram_notifier:
-            telegram_notifier.send_error_alert(f"Kill switch activation FAILED! {status[1]}")
+            # Trading is still enabled after a breach: send now, never behind queued PNL traffic
+            telegram_notifier.send_error_alert(f"Kill switch activation FAILED! {status[1]}", blocking=True)
 
 
 def send_periodic_pnl():
     """Send periodic PNL update via Telegram according to configured interval."""
-    global risk_manager, telegram_notifier
-
     if not CONFIG.get("TELEGRAM_ENABLED"):
         return
 
     if CONFIG.get("TELEGRAM_PNL_INTERVAL_SECONDS", 0) <= 0:
         return
 
-    if not is_market_hours():
+    now = datetime.now()
+    if not is_market_hours(now):
         logging.info("Outside market hours. Skipping Telegram periodic PNL update.")
         return
 
-    # Ensure instances exist
-    if risk_manager is None:
-        if CONFIG["TELEGRAM_ENABLED"]:
-            telegram_notifier = TelegramNotifier(
-                bot_token=CONFIG["TELEGRAM_BOT_TOKEN"],
-                chat_id=CONFIG["TELEGRAM_CHAT_ID"],
-                enabled=True
-            )
-        risk_manager = DhanRiskManager(CONFIG, telegram_notifier)
-
-    # If kill switch already triggered, cancel further periodic updates
+    # If kill switch already triggered, stop all jobs (normally monitor_risk has done so already)
     if risk_manager.kill_switch_triggered:
-        logging.info("Kill switch already active — cancelling periodic PNL job")
-        return schedule.CancelJob
+        logging.info("Kill switch already active — skipping periodic PNL update")
+        _stop_monitoring()
+        return
 
     result = risk_manager.get_positions_pnl()
     if result is None or result[0] is None:
@@ -1015,7 +1420,7 @@ def send_periodic_pnl():
         
         if telegram_notifier:
             if error_reason == "ACCESS_TOKEN_INVALID":
-                telegram_notifier.send_error_alert("⛔ <b>CRITICAL ERROR:</b> Access Token Invalid (Periodic Check).\n\n🛑 Script is terminating.")
+                telegram_notifier.send_error_alert("⛔ <b>CRITICAL ERROR:</b> Access Token Invalid (Periodic Check).\n\n🛑 Script is terminating.", blocking=True)
                 logging.critical("Terminating script due to invalid access token (Periodic Check).")
                 sys.exit(5) # Exit code 5: Do not restart
             else:
@@ -1025,16 +1430,27 @@ def send_periodic_pnl():
             sys.exit(5) # Exit code 5: Do not restart
         return
 
-    pnl, _ = result
-    positions_data = risk_manager._get_positions_for_telegram()
+    pnl, position_details = result
+    positions_data = risk_manager._get_positions_for_telegram(position_details)
 
     if telegram_notifier:
-        telegram_notifier.send_pnl_update(pnl, risk_manager.daily_stoploss, risk_manager.daily_target, positions_data)
+        telegram_notifier.send_pnl_update(
+            pnl, risk_manager.daily_stoploss, risk_manager.daily_target, positions_data, now=now, skip_unchanged=True
+        )
 
 # ============================================================================
 # MAIN EXECUTION
 # ============================================================================
 
+_REQUIRED_NUMERIC_KEYS = ("DAILY_STOPLOSS", "DAILY_TARGET", "CHECK_INTERVAL_SECONDS")
+_OPTIONAL_NUMERIC_KEYS = (
+    "POSITION_PERCENT_TAKE",
+    "POSITION_PERCENT_STOPLOSS",
+    "TRAILING_STOPLOSS_ACTIVATE_PROFIT",
+    "TRAILING_STOPLOSS_TRAIL_PERCENT",
+    "TELEGRAM_PNL_INTERVAL_SECONDS",
+)
+
 def validate_config():
     """Validate configuration before starting"""
     errors = []
@@ -1043,9 +1459,14 @@ def validate_config():
     if not access_token or access_token in {"YOUR_ACCESS_TOKEN_HERE", "your_dhan_access_token_here"}:
         errors.append("ACCESS_TOKEN not configured")
     
-    # Allow non-negative DAILY_STOPLOSS to enable kill-switch at breakeven or profit
-    if CONFIG.get("DAILY_STOPLOSS") is None:
-        errors.append("DAILY_STOPLOSS not configured")
+    # Numeric values are parsed leniently at import; report anything missing or unparseable here.
+    # Any DAILY_STOPLOSS is allowed: non-negative values enable the kill-switch at breakeven or profit
+    for key in _REQUIRED_NUMERIC_KEYS:
+        if CONFIG.get(key) is None:
+            errors.append(f"{key} not configured or not a number")
+    for key in _OPTIONAL_NUMERIC_KEYS:
+        if CONFIG.get(key) is None:
+            errors.append(f"{key} must be a number")
 
     # Warn if stoploss is >= target — kill-switch may trigger before reaching target
     try:
@@ -1062,12 +1483,19 @@ def validate_config():
         # If logging not yet configured or values invalid, skip the warning
         pass
     
-    if CONFIG["DAILY_TARGET"] <= 0:
+    if CONFIG["DAILY_TARGET"] is not None and CONFIG["DAILY_TARGET"] <= 0:
         errors.append("DAILY_TARGET must be positive")
     
-    if CONFIG["CHECK_INTERVAL_SECONDS"] < 1:
+    if CONFIG["CHECK_INTERVAL_SECONDS"] is not None and CONFIG["CHECK_INTERVAL_SECONDS"] < 1:
         errors.append("CHECK_INTERVAL_SECONDS must be at least 1")
 
+    # Parse market hours once so is_market_hours() doesn't re-parse them on every check
+    for key in ("MARKET_START_TIME", "MARKET_END_TIME"):
+        try:
+            CONFIG[f"{key}_PARSED"] = datetime.strptime(str(CONFIG.get(key)).strip(), "%H:%M").time()
+        except ValueError:
+            errors.append(f"Invalid {key} (expected HH:MM): {CONFIG.get(key)}")
+
     # Validate and parse RUN_DAYS
     run_days_str = str(CONFIG.get("RUN_DAYS", "WEEKDAYS")).upper().strip()
     allowed_days = set()
@@ -1112,24 +1540,27 @@ def validate_config():
         if not telegram_chat_id or telegram_chat_id in {"YOUR_CHAT_ID", "your_telegram_chat_id"}:
             errors.append("TELEGRAM_CHAT_ID not configured (Telegram is enabled)")
 
-    # Validate Trailing Stoploss config if enabled
+    # Validate Trailing Stoploss config if enabled (unparseable values were already reported above)
     if CONFIG["ENABLE_TRAILING_STOPLOSS"]:
-        if CONFIG["TRAILING_STOPLOSS_ACTIVATE_PROFIT"] <= 0:
+        activate_profit = CONFIG["TRAILING_STOPLOSS_ACTIVATE_PROFIT"]
+        trail_percent = CONFIG["TRAILING_STOPLOSS_TRAIL_PERCENT"]
+        if activate_profit is not None and activate_profit <= 0:
             errors.append("TRAILING_STOPLOSS_ACTIVATE_PROFIT must be positive")
-        if not (0 < CONFIG["TRAILING_STOPLOSS_TRAIL_PERCENT"] < 100):
+        if trail_percent is not None and not (0 < trail_percent < 100):
             errors.append("TRAILING_STOPLOSS_TRAIL_PERCENT must be between 0 and 100")
     
     return errors
 
 def main():
     """Main function to start the risk manager"""
+    global telegram_notifier, risk_manager
     
     # Setup logging
     setup_logging()
     
-    logging.info("=" * 70)
+    logging.info(_BAR)
     logging.info("DHAN RISK MANAGER - STARTING")
-    logging.info("=" * 70)
+    logging.info(_BAR)
     
     # Validate configuration
     errors = validate_config()
@@ -1139,6 +1570,9 @@ def main():
             logging.error(f"  - {error}")
         logging.error("\nPlease fix the configuration and restart.")
         sys.exit(1)
+
+    # From here on a stop request ends the process between jobs, never mid square-off
+    _install_signal_handlers()
     
     # Display configuration
     logging.info("\nConfiguration:")
@@ -1165,41 +1599,54 @@ def main():
         logging.info(f"    - Only Alerts Mode: {CONFIG['SEND_ONLY_ALERTS']}")
         if CONFIG.get('TELEGRAM_PNL_INTERVAL_SECONDS', 0) > 0:
             logging.info(f"    - Periodic PNL interval: {CONFIG['TELEGRAM_PNL_INTERVAL_SECONDS']} second(s) (per-check PNL disabled)")
-    logging.info("=" * 70)
+    logging.info(_BAR)
     
-    # Initialize Telegram and send startup message
+    # Initialize Telegram once (shared by all jobs) and send startup message
     if CONFIG["TELEGRAM_ENABLED"]:
-        telegram = TelegramNotifier(
+        telegram_notifier = TelegramNotifier(
             bot_token=CONFIG["TELEGRAM_BOT_TOKEN"],
             chat_id=CONFIG["TELEGRAM_CHAT_ID"],
             enabled=True
         )
         logging.info("\nSending Telegram startup notification...")
-        telegram.send_startup_message(CONFIG)
+        telegram_notifier.send_startup_message(CONFIG)
+
+    # One risk manager for the life of the process; the scheduled jobs use it directly
+    risk_manager = DhanRiskManager(CONFIG, telegram_notifier)
     
     # Initial check
     logging.info("\nPerforming initial PNL check...")
     monitor_risk()
     
-    # Schedule periodic checks
-    logging.info(f"\nScheduling checks every {CONFIG['CHECK_INTERVAL_SECONDS']} second(s)")
-    logging.info("Press Ctrl+C to stop\n")
-
-    schedule.every(CONFIG["CHECK_INTERVAL_SECONDS"]).seconds.do(monitor_risk)
-
-    # Schedule periodic Telegram PNL updates if enabled and interval > 0
-    if CONFIG.get("TELEGRAM_ENABLED") and CONFIG.get("TELEGRAM_PNL_INTERVAL_SECONDS", 0) > 0:
-        logging.info(f"Scheduling Telegram PNL updates every {CONFIG['TELEGRAM_PNL_INTERVAL_SECONDS']} second(s)")
-        schedule.every(CONFIG["TELEGRAM_PNL_INTERVAL_SECONDS"]).seconds.do(send_periodic_pnl)
-
-    try:
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logging.info("\n\n🛑 Script stopped by user")
-        logging.info("=" * 70)
-        sys.exit(0)
+    # Schedule periodic checks, unless the initial check already breached a limit and stopped monitoring
+    if not risk_manager.kill_switch_triggered:
+        logging.info(f"\nScheduling checks every {CONFIG['CHECK_INTERVAL_SECONDS']} second(s)")
+        logging.info("Press Ctrl+C to stop\n")
+
+        scheduler.every(CONFIG["CHECK_INTERVAL_SECONDS"], monitor_risk)
+
+        # Schedule periodic Telegram PNL updates if enabled and interval > 0
+        if CONFIG.get("TELEGRAM_ENABLED") and CONFIG.get("TELEGRAM_PNL_INTERVAL_SECONDS", 0) > 0:
+            logging.info(f"Scheduling Telegram PNL updates every {CONFIG['TELEGRAM_PNL_INTERVAL_SECONDS']} second(s)")
+            scheduler.every(CONFIG["TELEGRAM_PNL_INTERVAL_SECONDS"], send_periodic_pnl)
+
+    while not _shutdown_requested:
+        # Outside market hours nothing can run: sleep through to the next session in one go
+        # instead of waking every interval just to skip the check
+        until_open = seconds_until_market_open()
+        if until_open > 0:
+            logging.info("Outside market hours. Sleeping %.0f second(s) until the next session.", until_open)
+            _wait(until_open)
+            continue
+        scheduler.run_pending()
+        # Sleep until the next job is due. Once jobs are cleared (kill switch) the
+        # process stays alive but idle so service managers don't restart monitoring.
+        idle = scheduler.idle_seconds()
+        _wait(idle if idle is not None else 60)
+
+    logging.info("\n\n🛑 Script stopped (shutdown requested)")
+    logging.info(_BAR)
+    sys.exit(0)
 
 if __name__ == "__main__":
     main()
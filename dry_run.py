@@ -2,14 +2,13 @@
 
 This script simulates a handful of positions and demonstrates the
 percent-based profit-taking logic without calling the real Dhan API.
-It monkeypatches `get_positions_pnl` and `requests.post` to simulate
+It monkeypatches `get_positions_pnl` and the manager's HTTP session to simulate
 API responses and order placement.
 """
 import logging
-import requests
 from datetime import datetime
 
-from dhan_risk_manager import DhanRiskManager
+from dhan_risk_manager import DhanRiskManager, Position
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -87,20 +86,8 @@ def main():
     ]
 
     # Convert to manager's expected position_details structure
-    position_details = []
-    total_pnl = 0
-    for p in raw_positions:
-        realized = float(p.get('realizedProfit', 0))
-        unrealized = float(p.get('unrealizedProfit', 0))
-        total = realized + unrealized
-        total_pnl += total
-        position_details.append({
-            'symbol': p.get('tradingSymbol', 'N/A'),
-            'realized': realized,
-            'unrealized': unrealized,
-            'total': total,
-            'position_data': p
-        })
+    position_details = [Position.from_api(p) for p in raw_positions]
+    total_pnl = sum(pos.total for pos in position_details)
 
     # Instantiate manager
     manager = DhanRiskManager(cfg)
@@ -111,18 +98,16 @@ def main():
 
     manager.get_positions_pnl = fake_get_positions_pnl
 
-    # Monkeypatch requests.post used by square_off_position to simulate order placement
-    original_post = requests.post
-
-    def fake_post(url, headers=None, json=None, timeout=None, params=None):
-        logging.info(f"[fake_post] POST to {url} with payload: {json or params}")
+    # Monkeypatch the session request used for order placement to simulate the Dhan API
+    def fake_request(method, url, json=None, params=None, timeout=None, **kwargs):
+        logging.info(f"[fake_request] {method} {url} with payload: {json or params}")
         if url.rstrip('/').endswith('/orders'):
             return FakeResponse(200, {'orderId': 'DRYRUN-ORDER-001'})
         if url.rstrip('/').endswith('/killSwitch'):
             return FakeResponse(200, {'dhanClientId': 'CL-1', 'killSwitchStatus': 'activated'})
         return FakeResponse(200, {})
 
-    requests.post = fake_post
+    manager.session.request = fake_request
 
     try:
         print('\n--- Dry-run: Demonstrating per-position percent-taking ---')
@@ -131,11 +116,11 @@ def main():
         print('\nManager returned status:', status)
         print('\nRemaining positions list after dry-run (unchanged in simulation):')
         for pos in position_details:
-            print(f" - {pos['symbol']}: P&L=₹{pos['total']:.2f} | netQty={pos['position_data'].get('netQty')}")
+            print(f" - {pos.symbol}: P&L=₹{pos.total:.2f} | netQty={pos.net_qty}")
         print('\nNote: This was a simulated run; real API calls were not performed for positions retrieval.')
     finally:
-        # restore monkeypatched call
-        requests.post = original_post
+        # restore the session's own request method
+        del manager.session.request
 
 
 if __name__ == '__main__':
@@ -1,8 +1,11 @@
 import unittest
 from unittest.mock import MagicMock, patch
 
-# Since we can't easily import from the script, we recreate the necessary parts.
-# This test focuses on the logic within check_and_manage_risk.
+import dhan_risk_manager
+from dhan_risk_manager import DhanRiskManager, Position
+
+# The kill switch tests recreate the breach branch of check_and_manage_risk below;
+# OrderActionsTest drives the real square-off and kill switch calls.
 
 # Mock base CONFIG
 BASE_CONFIG = {
@@ -78,16 +81,27 @@ class SimplifiedDhanRiskManager:
         return ["WITHIN_LIMITS", "Success"]
 
 
+class FakeTelegram:
+    """Records kill switch alerts; the only notifier method this logic calls."""
+    def __init__(self):
+        self.calls = []
+
+    def send_kill_switch_alert(self, *args, **kwargs):
+        self.calls.append(('send_kill_switch_alert', args, kwargs))
+
+
 class TestKillSwitchFeature(unittest.TestCase):
 
     def setUp(self):
-        self.mock_telegram = MagicMock()
-        self.mock_telegram.send_kill_switch_alert = MagicMock()
+        self.fake_telegram = FakeTelegram()
+
+    def assertAlertSent(self, *args):
+        self.assertEqual(self.fake_telegram.calls[-1], ('send_kill_switch_alert', args, {}))
 
     def test_kill_switch_disabled_by_default_on_stoploss(self):
         """Test that kill switch is NOT triggered if ENABLE_KILL_SWITCH is False (default)."""
         config = BASE_CONFIG.copy()
-        rm = SimplifiedDhanRiskManager(config, self.mock_telegram)
+        rm = SimplifiedDhanRiskManager(config, self.fake_telegram)
         rm.get_positions_pnl.return_value = (-1100, [{'data': 'pos1'}]) # Breached SL
 
         status, reason = rm.check_and_manage_risk()
@@ -98,7 +112,7 @@ class TestKillSwitchFeature(unittest.TestCase):
         rm.trigger_kill_switch.assert_not_called()
 
         # Assert notification
-        self.mock_telegram.send_kill_switch_alert.assert_called_with("STOPLOSS", -1100, -1000.0, False)
+        self.assertAlertSent("STOPLOSS", -1100, -1000.0, False)
 
         # Assert return status
         self.assertEqual(status, "STOPLOSS_BREACHED")
@@ -108,7 +122,7 @@ class TestKillSwitchFeature(unittest.TestCase):
         """Test that kill switch IS triggered if ENABLE_KILL_SWITCH is True."""
         config = BASE_CONFIG.copy()
         config["ENABLE_KILL_SWITCH"] = True
-        rm = SimplifiedDhanRiskManager(config, self.mock_telegram)
+        rm = SimplifiedDhanRiskManager(config, self.fake_telegram)
         
         rm.get_positions_pnl.return_value = (-1100, [{'data': 'pos1'}]) # Breached SL
         rm.trigger_kill_switch.return_value = [True, "activated"]
@@ -121,7 +135,7 @@ class TestKillSwitchFeature(unittest.TestCase):
         rm.trigger_kill_switch.assert_called_once()
 
         # Assert notification
-        self.mock_telegram.send_kill_switch_alert.assert_called_with("STOPLOSS", -1100, -1000.0, True)
+        self.assertAlertSent("STOPLOSS", -1100, -1000.0, True)
 
         # Assert return status
         self.assertEqual(status, "STOPLOSS_BREACHED")
@@ -131,7 +145,7 @@ class TestKillSwitchFeature(unittest.TestCase):
         """Test the behavior when kill switch is enabled but the API call fails."""
         config = BASE_CONFIG.copy()
         config["ENABLE_KILL_SWITCH"] = True
-        rm = SimplifiedDhanRiskManager(config, self.mock_telegram)
+        rm = SimplifiedDhanRiskManager(config, self.fake_telegram)
 
         rm.get_positions_pnl.return_value = (-1100, [{'data': 'pos1'}]) # Breached SL
         rm.trigger_kill_switch.return_value = [False, "API Error 500"]
@@ -148,14 +162,14 @@ class TestKillSwitchFeature(unittest.TestCase):
     def test_kill_switch_disabled_by_default_on_target(self):
         """Test that kill switch is NOT triggered for target if ENABLE_KILL_SWITCH is False."""
         config = BASE_CONFIG.copy()
-        rm = SimplifiedDhanRiskManager(config, self.mock_telegram)
+        rm = SimplifiedDhanRiskManager(config, self.fake_telegram)
         rm.get_positions_pnl.return_value = (2100, [{'data': 'pos1'}]) # Breached target
 
         status, reason = rm.check_and_manage_risk()
 
         # Assert actions
         rm.trigger_kill_switch.assert_not_called()
-        self.mock_telegram.send_kill_switch_alert.assert_called_with("TARGET", 2100, 2000.0, False)
+        self.assertAlertSent("TARGET", 2100, 2000.0, False)
         self.assertEqual(status, "TARGET_ACHIEVED")
         self.assertEqual(reason, "Kill switch not enabled")
 
@@ -163,7 +177,7 @@ class TestKillSwitchFeature(unittest.TestCase):
         """Test that kill switch IS triggered for target if ENABLE_KILL_SWITCH is True."""
         config = BASE_CONFIG.copy()
         config["ENABLE_KILL_SWITCH"] = True
-        rm = SimplifiedDhanRiskManager(config, self.mock_telegram)
+        rm = SimplifiedDhanRiskManager(config, self.fake_telegram)
         
         rm.get_positions_pnl.return_value = (2100, [{'data': 'pos1'}]) # Breached target
         rm.trigger_kill_switch.return_value = [True, "activated"]
@@ -172,9 +186,75 @@ class TestKillSwitchFeature(unittest.TestCase):
 
         # Assert actions
         rm.trigger_kill_switch.assert_called_once()
-        self.mock_telegram.send_kill_switch_alert.assert_called_with("TARGET", 2100, 2000.0, True)
+        self.assertAlertSent("TARGET", 2100, 2000.0, True)
         self.assertEqual(status, "TARGET_ACHIEVED")
         self.assertEqual(reason, "activated")
 
+
+class OrderActionsTest(unittest.TestCase):
+    """Exercises the real DhanRiskManager square-off and kill switch calls with the HTTP layer patched."""
+
+    def setUp(self):
+        self.dhan = DhanRiskManager({"ACCESS_TOKEN": "test_token", "DAILY_STOPLOSS": -1000, "DAILY_TARGET": 2000})
+        patcher = patch('requests.Session.request')
+        self.mock_request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_request.return_value = MagicMock(status_code=200, json=MagicMock(return_value={"orderId": "1"}))
+
+    def test_flat_positions_are_not_counted_as_squared_off(self):
+        order_fields = {"exchangeSegment": "NSE_FNO", "productType": "INTRADAY", "securityId": "123"}
+        positions = [
+            Position.from_api({"tradingSymbol": "NIFTY", "netQty": 50, **order_fields}),
+            Position.from_api({"tradingSymbol": "BANKNIFTY", "netQty": 0, **order_fields}),
+        ]
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertTrue(self.dhan.square_off_all_positions(positions))
+
+        self.assertEqual(self.mock_request.call_count, 1)
+        self.assertTrue(any("1 successful, 0 failed" in line for line in logs.output))
+
+    def test_square_off_skips_position_missing_order_fields(self):
+        pos = Position.from_api({"tradingSymbol": "NIFTY", "netQty": 50, "exchangeSegment": "NSE_FNO"})
+
+        self.assertFalse(self.dhan.square_off_position(pos))
+        self.mock_request.assert_not_called()
+
+    def test_unparseable_quantity_is_a_failed_square_off(self):
+        pos = Position.from_api({"tradingSymbol": "NIFTY", "netQty": "n/a", "exchangeSegment": "NSE_FNO",
+                                 "productType": "INTRADAY", "securityId": "123"})
+        self.assertIsNone(pos.net_qty)
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertFalse(self.dhan.square_off_all_positions([pos]))
+
+        self.mock_request.assert_not_called()
+        self.assertTrue(any("0 successful, 1 failed" in line for line in logs.output))
+
+    def test_kill_switch_unexpected_response_is_a_failure(self):
+        self.mock_request.return_value.json.return_value = ["unexpected"]
+
+        with self.assertLogs(level='ERROR'):
+            activated, reason = self.dhan.trigger_kill_switch([])
+
+        self.assertFalse(activated)
+        self.assertIn("unexpected", reason)
+        self.assertFalse(self.dhan.kill_switch_triggered)
+
+
+class KillSwitchFailureAlertTest(unittest.TestCase):
+    def test_failed_activation_alert_is_sent_immediately(self):
+        risk_manager = MagicMock()
+        risk_manager.check_and_manage_risk.return_value = ["KILL_SWITCH_FAILED", "API Error 500"]
+        telegram = MagicMock()
+
+        with patch.object(dhan_risk_manager, 'risk_manager', risk_manager), \
+             patch.object(dhan_risk_manager, 'telegram_notifier', telegram), \
+             patch.object(dhan_risk_manager, 'is_market_hours', return_value=True), \
+             self.assertLogs(level='ERROR'):
+            dhan_risk_manager.monitor_risk()
+
+        telegram.send_error_alert.assert_called_once_with("Kill switch activation FAILED! API Error 500", blocking=True)
+
 if __name__ == '__main__':
     unittest.main()
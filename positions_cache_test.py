@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from dhan_risk_manager import DhanRiskManager
+
+
+class PositionsCacheTest(unittest.TestCase):
+    """DhanRiskManager.get_positions_pnl() shares one fetch between jobs that fall due together."""
+
+    def setUp(self):
+        self.dhan = DhanRiskManager({"ACCESS_TOKEN": "test_token", "DAILY_STOPLOSS": -1000, "DAILY_TARGET": 2000})
+        patcher = patch('requests.Session.request')
+        self.mock_request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_request.return_value = MagicMock(status_code=200, json=MagicMock(return_value=[
+            {"tradingSymbol": "NIFTY", "realizedProfit": 100, "unrealizedProfit": 0, "netQty": 50,
+             "exchangeSegment": "NSE_FNO", "productType": "INTRADAY", "securityId": "123"},
+        ]))
+
+    def positions_fetches(self):
+        return sum(1 for c in self.mock_request.call_args_list if c.args[0] == "GET")
+
+    def test_positions_fetch_is_reused_briefly(self):
+        first = self.dhan.get_positions_pnl()
+        second = self.dhan.get_positions_pnl()
+        self.assertIs(first, second)
+        self.assertEqual(self.positions_fetches(), 1)
+
+        # An expired entry is refetched
+        self.dhan._positions_cache = (0.0, first)
+        self.dhan.get_positions_pnl()
+        self.assertEqual(self.positions_fetches(), 2)
+
+    def test_square_off_invalidates_cached_positions(self):
+        _, positions = self.dhan.get_positions_pnl()
+
+        self.dhan.square_off_all_positions(positions)
+        self.dhan.get_positions_pnl()
+
+        self.assertEqual(self.positions_fetches(), 2)
+
+    def test_failed_square_off_also_invalidates_cached_positions(self):
+        _, positions = self.dhan.get_positions_pnl()
+        # The order may still have gone through even though the response was an error
+        self.mock_request.return_value = MagicMock(status_code=500, text="gateway timeout")
+
+        # Per-position percent exits call square_off_position directly
+        self.assertFalse(self.dhan.square_off_position(positions[0]))
+        self.dhan.get_positions_pnl()
+
+        self.assertEqual(self.positions_fetches(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from datetime import datetime, time
+from unittest.mock import patch
+
+from dhan_risk_manager import CONFIG, Scheduler, seconds_until_market_open
+
+
+class FakeClock:
+    """Stands in for time.monotonic() so tests control the passage of time."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('dhan_risk_manager.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = Scheduler()
+        self.calls = []
+
+    def test_job_runs_only_when_due(self):
+        self.scheduler.every(5, lambda: self.calls.append('a'))
+
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, [])
+        self.assertAlmostEqual(self.scheduler.idle_seconds(), 5.0)
+
+        self.clock.now += 5
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, ['a'])
+        self.assertAlmostEqual(self.scheduler.idle_seconds(), 5.0)
+
+    def test_cadence_does_not_drift(self):
+        self.scheduler.every(5, lambda: self.calls.append('a'))
+
+        # Job runs slightly late; the next run stays on the original 5s grid
+        self.clock.now += 5.4
+        self.scheduler.run_pending()
+        self.assertAlmostEqual(self.scheduler.idle_seconds(), 4.6)
+
+    def test_missed_runs_are_skipped(self):
+        self.scheduler.every(1, lambda: self.calls.append('a'))
+
+        # After a long stall the job runs once, not once per missed interval
+        self.clock.now += 10
+        self.scheduler.run_pending()
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, ['a'])
+
+    def test_due_jobs_run_earliest_first(self):
+        self.scheduler.every(3, lambda: self.calls.append('slow'))
+        self.scheduler.every(1, lambda: self.calls.append('fast'))
+
+        self.clock.now += 3
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, ['fast', 'slow'])
+        self.assertAlmostEqual(self.scheduler.idle_seconds(), 1.0)
+
+    def test_clear_from_inside_job_stops_other_jobs(self):
+        self.scheduler.every(1, self.scheduler.clear)
+        self.scheduler.every(1, lambda: self.calls.append('b'))
+
+        self.clock.now += 1
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, [])
+        self.assertIsNone(self.scheduler.idle_seconds())
+
+
+class SecondsUntilMarketOpenTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.dict(CONFIG, {
+            "MARKET_START_TIME_PARSED": time(9, 15),
+            "MARKET_END_TIME_PARSED": time(15, 30),
+            "ALLOWED_DAYS_SET": set(range(5)),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_zero_during_market_hours(self):
+        # Wednesday mid-session
+        self.assertEqual(seconds_until_market_open(datetime(2024, 1, 3, 11, 0)), 0.0)
+
+    def test_before_open_waits_for_today(self):
+        self.assertEqual(seconds_until_market_open(datetime(2024, 1, 3, 9, 0)), 15 * 60)
+
+    def test_after_close_on_friday_waits_for_monday(self):
+        # Friday 16:15 -> Monday 09:15
+        self.assertEqual(seconds_until_market_open(datetime(2024, 1, 5, 16, 15)), (2 * 24 + 17) * 3600)
+
+
+if __name__ == '__main__':
+    unittest.main()
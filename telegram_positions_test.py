@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import MagicMock, patch
-from dhan_risk_manager import DhanRiskManager, CONFIG
+from dhan_risk_manager import DhanRiskManager, TelegramNotifier, CONFIG
 
 class TelegramPositionsTest(unittest.TestCase):
     def setUp(self):
@@ -12,7 +12,13 @@ class TelegramPositionsTest(unittest.TestCase):
         }
         self.dhan = DhanRiskManager(self.config)
 
-    @patch('requests.get')
+    def enabled_notifier(self):
+        """A notifier that takes messages as if enabled, without starting the sender thread"""
+        telegram = TelegramNotifier("bot_token", "chat_id", enabled=False)
+        telegram.enabled = True
+        return telegram
+
+    @patch('requests.Session.request')
     def test_get_positions_for_telegram(self, mock_get):
         # Sample API response from Dhan
         mock_response_data = [
@@ -44,10 +50,13 @@ class TelegramPositionsTest(unittest.TestCase):
         mock_response.json.return_value = mock_response_data
         mock_get.return_value = mock_response
 
-        # Call the method
-        positions = self.dhan._get_positions_for_telegram()
+        # Fetch once, then build the Telegram view from the same position details
+        _, position_details = self.dhan.get_positions_pnl()
+        positions = self.dhan._get_positions_for_telegram(position_details)
 
         # Assertions
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args[0][1], "https://api.dhan.co/positions")
         self.assertEqual(len(positions), 4)
 
         # 1. Open position (unrealized profit is non-zero)
@@ -66,5 +75,106 @@ class TelegramPositionsTest(unittest.TestCase):
         self.assertEqual(positions[3]['symbol'], 'SENSEX')
         self.assertEqual(positions[3]['status'], 'OPEN')
 
+    def test_pnl_update_lists_positions(self):
+        telegram = self.enabled_notifier()
+        telegram.queue_message = MagicMock(return_value=True)
+        positions = [
+            {'symbol': 'BANKNIFTY', 'total': 1500.5, 'status': 'OPEN'},
+            {'symbol': 'NIFTY', 'total': -200.0, 'status': ''},
+        ]
+
+        telegram.send_pnl_update(1300.5, -1000, 2000, positions)
+
+        message = telegram.queue_message.call_args[0][0]
+        self.assertIn("🟢 BANKNIFTY: ₹1,500.50 (OPEN)", message)
+        self.assertIn("🔴 NIFTY: ₹-200.00\n", message)
+
+    def test_disabled_notifier_sends_nothing(self):
+        telegram = TelegramNotifier("bot_token", "chat_id", enabled=False)
+        telegram.queue_message = MagicMock()
+        telegram.send_message = MagicMock()
+
+        self.assertFalse(telegram.send_pnl_update(100.0, -1000, 2000, []))
+        self.assertFalse(telegram.send_kill_switch_alert("STOPLOSS", -1000.0, -1000))
+        self.assertFalse(telegram.send_error_alert("boom"))
+
+        telegram.queue_message.assert_not_called()
+        telegram.send_message.assert_not_called()
+
+    def test_error_alert_is_queued_unless_blocking(self):
+        telegram = self.enabled_notifier()
+        telegram.queue_message = MagicMock(return_value=True)
+        telegram.send_message = MagicMock(return_value=True)
+
+        telegram.send_error_alert("fetch failed")
+        telegram.queue_message.assert_called_once()
+        telegram.send_message.assert_not_called()
+
+        telegram.send_error_alert("token invalid", blocking=True)
+        telegram.send_message.assert_called_once()
+
+    def test_queued_pnl_updates_collapse_to_latest(self):
+        telegram = self.enabled_notifier()
+        telegram.send_message = MagicMock(return_value=True)
+
+        telegram.queue_message("pnl 1", latest_only=True)
+        telegram.queue_message("alert")
+        telegram.queue_message("pnl 2", latest_only=True)
+        self.assertEqual(telegram._queue.qsize(), 2)
+
+        with patch('dhan_risk_manager.time.sleep'):
+            telegram._send_next()
+            telegram._send_next()
+
+        sent = [c.args[0] for c in telegram.send_message.call_args_list]
+        self.assertEqual(sent, ["pnl 2", "alert"])
+
+    def test_unchanged_periodic_pnl_is_skipped_until_heartbeat(self):
+        telegram = self.enabled_notifier()
+        telegram.queue_message = MagicMock(return_value=True)
+        positions = [{'symbol': 'NIFTY', 'total': 100.0, 'status': 'OPEN'}]
+
+        with patch('dhan_risk_manager.time.monotonic', side_effect=[1000.0, 1010.0, 1020.0, 1400.0]):
+            self.assertTrue(telegram.send_pnl_update(100.0, -1000, 2000, positions, skip_unchanged=True))
+            self.assertFalse(telegram.send_pnl_update(100.0, -1000, 2000, positions, skip_unchanged=True))
+            self.assertTrue(telegram.send_pnl_update(150.0, -1000, 2000, positions, skip_unchanged=True))
+            self.assertTrue(telegram.send_pnl_update(150.0, -1000, 2000, positions, skip_unchanged=True))  # Heartbeat
+
+        self.assertEqual(telegram.queue_message.call_count, 3)
+
+    def test_dropped_periodic_pnl_does_not_suppress_the_next(self):
+        telegram = self.enabled_notifier()
+        telegram.queue_message = MagicMock(side_effect=[False, True])  # Queue full, then accepted
+        positions = [{'symbol': 'NIFTY', 'total': 100.0, 'status': 'OPEN'}]
+
+        self.assertFalse(telegram.send_pnl_update(100.0, -1000, 2000, positions, skip_unchanged=True))
+        self.assertTrue(telegram.send_pnl_update(100.0, -1000, 2000, positions, skip_unchanged=True))
+
+    def test_synchronous_alerts_are_not_retried(self):
+        telegram = self.enabled_notifier()
+        telegram.session.post = MagicMock(return_value=MagicMock(status_code=200))
+        telegram.alert_session.post = MagicMock(return_value=MagicMock(status_code=200))
+
+        telegram.send_message("breach")
+        telegram.alert_session.post.assert_called_once()
+        telegram.session.post.assert_not_called()
+
+        telegram.send_message("update", retry=True)
+        telegram.session.post.assert_called_once()
+        self.assertEqual(telegram.alert_session.get_adapter(telegram.send_url).max_retries.total, 0)
+
+    def test_worker_paces_sends(self):
+        telegram = TelegramNotifier("bot_token", "chat_id", enabled=False)
+        sleeps = []
+        with patch('dhan_risk_manager.time.monotonic', return_value=1000.0), \
+             patch('dhan_risk_manager.time.sleep', side_effect=sleeps.append):
+            telegram._wait_for_send_slot()  # Nothing sent yet
+            telegram._sent_at.append(999.75)
+            telegram._wait_for_send_slot()  # Too soon after the last send
+            telegram._sent_at.extend([950.0] + [960.0] * (telegram.MAX_SENDS_PER_MINUTE - 1))
+            telegram._wait_for_send_slot()  # Per-minute budget used up
+
+        self.assertEqual(sleeps, [0.75, 10.0])
+
 if __name__ == '__main__':
     unittest.main()